@@ -0,0 +1,106 @@
+import numpy as np
+
+import map_cache
+import paradox_script
+
+
+class AdjacencyGraph:
+    """Province adjacency in CSR form: the neighbours of province ``p`` are
+    ``indices[indptr[p]:indptr[p + 1]]``, and ``lengths`` holds the length in
+    pixel edges of each shared border."""
+
+    def __init__(self, indptr, indices, lengths=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+
+    @property
+    def count(self):
+        return len(self.indptr) - 1
+
+    def neighbors(self, label):
+        return self.indices[self.indptr[label]:self.indptr[label + 1]]
+
+    def edge_sources(self):
+        return np.repeat(np.arange(self.count, dtype=np.int32), np.diff(self.indptr))
+
+    def coastal(self, is_sea):
+        flags = np.zeros(self.count, bool)
+        flags[self.edge_sources()[is_sea[self.indices]]] = True
+        return flags & ~is_sea
+
+    def coast_lengths(self, is_sea):
+        """Pixel edges each land province shares with sea provinces."""
+        to_sea = is_sea[self.indices]
+        lengths = np.bincount(self.edge_sources()[to_sea], weights=self.lengths[to_sea], minlength=self.count)
+        lengths[is_sea] = 0
+        return lengths.astype(np.int64)
+
+    def components(self, labels):
+        remaining = set(int(label) for label in labels)
+        parts = []
+        while remaining:
+            start = remaining.pop()
+            part = [start]
+            stack = [start]
+            while stack:
+                for neighbor in self.neighbors(stack.pop()).tolist():
+                    if neighbor in remaining:
+                        remaining.remove(neighbor)
+                        part.append(neighbor)
+                        stack.append(neighbor)
+            parts.append(part)
+        return parts
+
+
+def build_adjacency(labels, count, wrap_x=True, band=1024):
+    """Extract every pair of touching provinces by comparing the label map
+    with itself shifted one pixel right and one pixel down, a band of rows
+    (plus the row below it) at a time."""
+    sources, targets = [], []
+    height = labels.shape[0]
+    for y in range(0, height, band):
+        block = labels[y:min(y + band + 1, height)]
+        rows = block[:band]
+        pairs = [(rows[:, :-1], rows[:, 1:]), (block[:-1], block[1:])]
+        if wrap_x:
+            pairs.append((rows[:, -1], rows[:, 0]))
+        for a, b in pairs:
+            mask = a != b
+            sources.append(a[mask])
+            targets.append(b[mask])
+    a = np.concatenate(sources).astype(np.int64)
+    b = np.concatenate(targets).astype(np.int64)
+
+    keys, counts = np.unique(np.minimum(a, b) * count + np.maximum(a, b), return_counts=True)
+    lo, hi = keys // count, keys % count
+    src = np.concatenate((lo, hi))
+    dst = np.concatenate((hi, lo))
+    order = np.argsort(src, kind="stable")
+
+    indptr = np.zeros(count + 1, np.int64)
+    np.cumsum(np.bincount(src, minlength=count), out=indptr[1:])
+    lengths = np.concatenate((counts, counts))[order].astype(np.int32)
+    return AdjacencyGraph(indptr, dst[order].astype(np.int32), lengths)
+
+
+def load_adjacency(path, index):
+    def build():
+        graph = build_adjacency(index.labels, index.count)
+        return {"indptr": graph.indptr, "indices": graph.indices, "lengths": graph.lengths}
+
+    # "-2": caches written before border lengths were stored lack them
+    arrays = map_cache.cached_arrays(path, "adjacency-2", build)
+    return AdjacencyGraph(arrays["indptr"], arrays["indices"], arrays["lengths"])
+
+
+def read_sea_provinces(path, index):
+    """Sea provinces listed in a default.map file, as a flag per label."""
+    with open(path, encoding="utf-8-sig") as f:
+        script = paradox_script.parse(f.read())
+    codes = [code for key, value in paradox_script.pairs(script) if key == "sea_starts"
+             for code in paradox_script.values(value)]
+    labels = index.labels_of(codes)
+    is_sea = np.zeros(index.count, bool)
+    is_sea[labels[labels >= 0]] = True
+    return is_sea
@@ -0,0 +1,69 @@
+import numpy as np
+
+from tiled_store import TiledArray
+
+PROVINCE_EDGE = 1
+STATE_EDGE = 2
+
+
+def pool_or(flags):
+    """Halve ``flags`` in both directions, OR-ing each 2x2 block, so a border
+    one pixel wide survives at every zoom level."""
+    h, w = flags.shape
+    padded = np.zeros((h + h % 2, w + w % 2), flags.dtype)
+    padded[:h, :w] = flags
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    return np.bitwise_or.reduce(np.bitwise_or.reduce(blocks, axis=3), axis=1)
+
+
+class BorderMask:
+    """Border flags (PROVINCE_EDGE | STATE_EDGE) per map pixel, with an
+    OR-pooled pyramid matching the renderer's zoom levels.
+
+    A pixel is flagged when its right or lower neighbour is in another
+    province or another state. Province edges never change; state edges are
+    recomputed only inside the boxes passed to ``update``."""
+
+    def __init__(self, labels, owner, levels, band=512):
+        self.labels = labels
+        self.band = band
+        # a tiled map gets tiled flags, so they page like the labels do
+        zeros = TiledArray.empty if isinstance(labels, TiledArray) else np.zeros
+        height, width = labels.shape
+        self.levels = [zeros((height, width), np.uint8)]
+        for _ in range(levels - 1):
+            h, w = self.levels[-1].shape
+            self.levels.append(zeros(((h + 1) // 2, (w + 1) // 2), np.uint8))
+        self.update((0, 0, width, height), owner)
+
+    def _compute(self, x0, y0, x1, y1, owner):
+        height, width = self.labels.shape
+        labels = self.labels[y0:min(y1 + 1, height), x0:min(x1 + 1, width)]
+        states = owner[labels]
+        flags = np.zeros(labels.shape, np.uint8)
+        for a, b, target in ((labels[:, :-1], labels[:, 1:], flags[:, :-1]),
+                             (labels[:-1], labels[1:], flags[:-1])):
+            target |= (a != b).view(np.uint8) * np.uint8(PROVINCE_EDGE)
+        for a, b, target in ((states[:, :-1], states[:, 1:], flags[:, :-1]),
+                             (states[:-1], states[1:], flags[:-1])):
+            target |= (a != b).view(np.uint8) * np.uint8(STATE_EDGE)
+        self.levels[0][y0:y1, x0:x1] = flags[:y1 - y0, :x1 - x0]
+
+    def update(self, bbox, owner):
+        """Recompute the flags of map box ``bbox`` (x0, y0, x1, y1; exclusive
+        ends) after its provinces changed state, and of the pyramid above it.
+        Returns the box whose pixels may have changed."""
+        height, width = self.labels.shape
+        # a pixel's flags also depend on its right and lower neighbours
+        x0, y0 = max(0, int(bbox[0]) - 1), max(0, int(bbox[1]) - 1)
+        x1, y1 = min(width, int(bbox[2])), min(height, int(bbox[3]))
+        for y in range(y0, y1, self.band):
+            self._compute(x0, y, x1, min(y + self.band, y1), owner)
+
+        box = (x0, y0, x1, y1)
+        for level in range(1, len(self.levels)):
+            box = (box[0] // 2, box[1] // 2, (box[2] + 1) // 2, (box[3] + 1) // 2)
+            below = self.levels[level - 1][box[1] * 2:box[3] * 2, box[0] * 2:box[2] * 2]
+            pooled = pool_or(below)
+            self.levels[level][box[1]:box[3], box[0]:box[2]] = pooled[:box[3] - box[1], :box[2] - box[0]]
+        return x0, y0, x1, y1
@@ -0,0 +1,54 @@
+import colorsys
+
+import numpy as np
+
+GOLDEN_RATIO = 0.6180339887498949
+# (saturation, value) tiers cycled between consecutive colours
+TIERS = [(0.85, 0.95), (0.55, 0.80), (0.90, 0.65), (0.45, 0.95), (0.75, 0.50)]
+PROBES = 64
+
+
+class ColorAllocator:
+    """Hands out state colours that no province and no other state uses.
+
+    Every 24-bit colour has one bit in a 2 MB bitset, so checking and marking
+    a colour is O(1). Colours step around the hue circle by the golden ratio
+    and cycle through saturation/value tiers, so consecutive states (e.g. a
+    batch of imported ones) come out visibly different; a taken colour is
+    nudged in its low bits."""
+
+    def __init__(self, province_colors=()):
+        self.bits = np.zeros(1 << 21, np.uint8)
+        self.n = 0
+        colors = np.asarray(province_colors, np.int64)
+        np.bitwise_or.at(self.bits, colors >> 3, (1 << (colors & 7)).astype(np.uint8))
+
+    def is_used(self, color):
+        return bool(self.bits[color >> 3] >> (color & 7) & 1)
+
+    def _mark(self, color):
+        self.bits[color >> 3] |= 1 << (color & 7)
+
+    def reserve(self, hex_colors):
+        """Mark state colours that are already in use, e.g. of a loaded project,
+        and continue the sequence after them."""
+        for hex_color in hex_colors:
+            if hex_color:
+                self._mark(int(hex_color.lstrip("#"), 16))
+                self.n += 1
+
+    def _candidate(self):
+        hue = (self.n * GOLDEN_RATIO) % 1.0
+        saturation, value = TIERS[self.n % len(TIERS)]
+        self.n += 1
+        r, g, b = (int(round(c * 255)) for c in colorsys.hsv_to_rgb(hue, saturation, value))
+        return r << 16 | g << 8 | b
+
+    def allocate(self):
+        """A free colour as "#rrggbb", marked as used."""
+        while True:
+            color = self._candidate()
+            for probe in range(PROBES):
+                if not self.is_used(color ^ probe):
+                    self._mark(color ^ probe)
+                    return "#{:06x}".format(color ^ probe)
@@ -0,0 +1,73 @@
+class Journal:
+    """Undo/redo history of registry operations.
+
+    A step is a list of small entries (province labels, slots and field
+    values, never pixels), recorded by StateRegistry while the step is open:
+
+        ("owner", label, old_slot, new_slot)
+        ("hub", slot, hub, old_label, new_label)
+        ("field", slot, name, old_value, new_value)
+        ("id", slot, old_id, new_id)
+        ("current", old_slot, new_slot)
+
+    Entries recorded outside ``begin()``/``commit()`` become a step of their
+    own; consecutive edits of the same field are merged into one step."""
+
+    def __init__(self, limit=10000):
+        self.limit = limit
+        self.undo_steps = []
+        self.redo_steps = []
+        self.step = None
+        self.depth = 0
+
+    def begin(self):
+        # nested begin/commit pairs fold into the outermost step
+        if self.depth == 0:
+            self.step = []
+        self.depth += 1
+
+    def commit(self):
+        self.depth -= 1
+        if self.depth > 0:
+            return
+        step, self.step = self.step, None
+        if step:
+            self._push(step)
+
+    def record(self, entry):
+        if self.step is not None:
+            self.step.append(entry)
+            return
+        if entry[0] == "field" and self.undo_steps and len(self.undo_steps[-1]) == 1:
+            last = self.undo_steps[-1][0]
+            if last[:3] == entry[:3]:
+                self.undo_steps[-1][0] = last[:4] + entry[4:]
+                self.redo_steps.clear()
+                return
+        self._push([entry])
+
+    def _push(self, step):
+        self.undo_steps.append(step)
+        self.redo_steps.clear()
+        if len(self.undo_steps) > self.limit:
+            del self.undo_steps[0]
+
+    def undo(self):
+        if not self.undo_steps:
+            return None
+        step = self.undo_steps.pop()
+        self.redo_steps.append(step)
+        return step
+
+    def redo(self):
+        if not self.redo_steps:
+            return None
+        step = self.redo_steps.pop()
+        self.undo_steps.append(step)
+        return step
+
+    def clear(self):
+        self.undo_steps.clear()
+        self.redo_steps.clear()
+        self.step = None
+        self.depth = 0
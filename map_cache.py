@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+def cache_dir():
+    path = os.environ.get("VSP_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "vsp")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_hash(path):
+    """Content hash of ``path``. Hashes are remembered per (path, size, mtime),
+    so an unchanged file is not re-read on every launch."""
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    hashes_path = os.path.join(cache_dir(), "hashes.json")
+    try:
+        with open(hashes_path) as f:
+            hashes = json.load(f)
+    except (OSError, ValueError):
+        hashes = {}
+    entry = hashes.get(key)
+    if entry is not None and entry["stamp"] == stamp:
+        return entry["hash"]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    hashes[key] = {"stamp": stamp, "hash": digest.hexdigest()}
+    try:
+        temp_path = f"{hashes_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(hashes, f)
+        os.replace(temp_path, hashes_path)
+    except OSError:
+        pass
+    return hashes[key]["hash"]
+
+
+def _load_arrays(cache_path):
+    return {entry[:-4]: np.load(os.path.join(cache_path, entry), mmap_mode="r")
+            for entry in os.listdir(cache_path) if entry.endswith(".npy")}
+
+
+def cached_arrays(path, name, build):
+    """Return the arrays ``build()`` derives from the file at ``path``.
+
+    The arrays are stored as .npy files in a directory named after the file's
+    content hash and are memory-mapped read-only, also right after building
+    them, so a start shares pages with the OS cache instead of holding copies."""
+    cache_path = os.path.join(cache_dir(), f"{file_hash(path)}-{name}")
+    if os.path.isdir(cache_path):
+        try:
+            return _load_arrays(cache_path)
+        except (OSError, ValueError):
+            shutil.rmtree(cache_path, ignore_errors=True)
+
+    arrays = build()
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        for key, array in arrays.items():
+            np.save(os.path.join(temp_path, key + ".npy"), array)
+        os.replace(temp_path, cache_path)
+        return _load_arrays(cache_path)
+    except (OSError, ValueError):
+        shutil.rmtree(temp_path, ignore_errors=True)
+    return arrays
@@ -0,0 +1,319 @@
+import numpy as np
+
+import project
+from adjacency import build_adjacency, load_adjacency, read_sea_provinces
+from color_allocator import ColorAllocator
+from journal import Journal
+from profiler import Profiler
+from province_map import load_province_index
+from province_stats import ProvinceStats, load_stats
+from states import State, StateRegistry, find_duplicates, format_state, read_state_files
+from terrain import TerrainMap
+from validation import Validator
+
+
+class PainterCore:
+    """Map and state logic of the painter, independent of Tk.
+
+    Holds the province index, the display colour LUT, the state registry and
+    its undo journal. ``on_repaint(bbox)`` is called for every map region
+    whose colours changed, so a view can invalidate what it shows."""
+
+    def __init__(self, on_repaint=None, profiler=None):
+        self.on_repaint = on_repaint
+        self.profiler = profiler or Profiler()
+        self.province_index = None
+        self.map_path = None
+        self.project_path = None
+        self.display_colors = None
+        self.adjacency = None
+        self.coastal = None
+        self.is_sea = None
+        self.validator = None
+        self.stats = None
+        self.terrain = None
+        self.journal = Journal()
+        self.colors = ColorAllocator()
+        self.registry = StateRegistry(journal=self.journal)
+        self.current_state = self.registry.add(State(color=self.colors.allocate()))
+
+    def load_map(self, path):
+        index = load_province_index(path)
+        self.set_index(index, load_adjacency(path, index), load_stats(path, index))
+        self.map_path = path
+
+    def set_index(self, index, adjacency=None, stats=None):
+        self.close_project()
+        self.province_index = index
+        self.map_path = None
+        self.adjacency = adjacency if adjacency is not None else build_adjacency(index.labels, index.count)
+        self.stats = stats if stats is not None else ProvinceStats.from_index(index)
+        self.terrain = TerrainMap(index.count)
+        self.coastal = None
+        self.is_sea = None
+        if self.validator is not None:
+            self.validator.close()
+            self.validator = None
+        self.display_colors = index.rgb.copy()
+        self.colors = ColorAllocator(index.colors)
+        self.registry = StateRegistry(index.count, self.journal)
+        self.current_state = self.registry.add(State(color=self.colors.allocate()))
+        self.journal.clear()
+
+    def label_at(self, x, y):
+        index = self.province_index
+        if index is None or not (0 <= x < index.width and 0 <= y < index.height):
+            return None
+        return index.label_at(x, y)
+
+    def recolor_provinces(self, labels, colors):
+        labels = np.atleast_1d(labels)
+        with self.profiler.stage("recolor"):
+            self.display_colors[labels] = colors
+            self.profiler.count("provinces_recolored", len(labels))
+            if self.on_repaint is None:
+                return
+            if len(labels) > 64:
+                self.on_repaint(self.province_index.bbox(labels))
+                return
+            for label in labels:
+                self.on_repaint(self.province_index.bboxes[label])
+
+    def repaint_provinces(self, labels):
+        labels = np.atleast_1d(labels)
+        owners = self.registry.owner[labels]
+        colors = np.where((owners > 0)[:, None], self.registry.slot_colors(owners), self.province_index.rgb[labels])
+        self.recolor_provinces(labels, colors)
+
+    def repaint_all(self):
+        self.repaint_provinces(np.arange(self.province_index.count))
+
+    def toggle_province(self, label, reassign=False, hub=None):
+        """Add ``label`` to the current state, or remove it if it is already
+        there. Provinces of other states are only taken with ``reassign``.
+        Returns whether anything changed."""
+        owner = self.registry.owner_of(label)
+        state = self.current_state
+        if owner is not None and owner is not state and not reassign:
+            return False
+
+        with self.profiler.stage("toggle"):
+            self.journal.begin()
+            if owner is state:
+                self.registry.unassign(label)
+            else:
+                self.registry.assign(state, label)
+                if hub:
+                    self.registry.set_hub(state, hub, label)
+            self.journal.commit()
+        self.repaint_provinces(label)
+        return True
+
+    def select_provinces(self, labels, remove=False, reassign=False):
+        """Add ``labels`` to the current state (or remove those it owns) as one
+        undo step with one repaint. Returns the labels that changed."""
+        labels = np.atleast_1d(labels)
+        owners = self.registry.owner[labels]
+        slot = self.current_state.slot
+        if remove:
+            changed = labels[owners == slot]
+        else:
+            changed = labels[(owners == 0) | (reassign & (owners != slot))]
+        if not len(changed):
+            return changed
+
+        with self.profiler.stage("select"):
+            self.journal.begin()
+            for label in changed.tolist():
+                if remove:
+                    self.registry.unassign(label)
+                else:
+                    self.registry.assign(self.current_state, label)
+            self.journal.commit()
+        self.repaint_provinces(changed)
+        return changed
+
+    def set_current_state(self, state):
+        self.registry.record(("current", self.current_state.slot, state.slot))
+        self.current_state = state
+
+    def new_state(self):
+        self.set_current_state(self.registry.add(State(color=self.colors.allocate())))
+
+    def save_current_state(self, state_id):
+        self.journal.begin()
+        self.registry.save(self.current_state, state_id)
+        self.new_state()
+        self.journal.commit()
+
+    def edit_state(self, state):
+        if state is self.current_state:
+            return
+        self.journal.begin()
+        if not self.registry.is_saved(self.current_state):
+            labels = self.current_state.province_array()
+            self.registry.remove(self.current_state)
+            if len(labels):
+                self.repaint_provinces(labels)
+        self.set_current_state(state)
+        self.journal.commit()
+
+    def change_color(self):
+        self.registry.set_field(self.current_state, "color", self.colors.allocate())
+        if self.current_state.provinces:
+            self.repaint_provinces(self.current_state.province_array())
+
+    def undo(self):
+        return self.replay(self.journal.undo(), undo=True)
+
+    def redo(self):
+        return self.replay(self.journal.redo(), undo=False)
+
+    def replay(self, step, undo):
+        if not step or self.province_index is None:
+            return False
+        journal, self.registry.journal = self.registry.journal, None
+        labels = []
+        for entry in reversed(step) if undo else step:
+            label = self.registry.apply(entry, undo)
+            if entry[0] == "current":
+                self.current_state = self.registry.slots[entry[1] if undo else entry[2]]
+                continue
+            if label is not None:
+                labels.append(label)
+            elif entry[0] == "field" and entry[2] == "color":
+                labels.extend(self.registry.slots[entry[1]].provinces)
+        self.registry.journal = journal
+        if labels:
+            self.repaint_provinces(np.array(labels))
+        return True
+
+    def import_state_files(self, paths):
+        """Add the states of ``paths`` to the registry (replacing states with the
+        same ID) and repaint the map once. Returns the unknown province codes
+        and the duplicates in the files (see ``find_duplicates``); of those,
+        the state read last keeps the province or ID."""
+        with self.profiler.stage("read_states"):
+            states, missing = read_state_files(paths, self.province_index)
+            duplicates = find_duplicates(states)
+        # undo does not reach back across an import
+        self.registry.journal = None
+        replaced_current = False
+        for state in states:
+            existing = self.registry.by_id.get(state.state_id)
+            if existing is not None:
+                replaced_current |= existing is self.current_state
+                self.registry.remove(existing)
+            if state.state_id is None:
+                state.state_id = self.next_free_id()
+            state.color = self.colors.allocate()
+            self.registry.add(state)
+
+        self.repaint_all()
+        if replaced_current:
+            self.new_state()
+        self.registry.journal = self.journal
+        self.journal.clear()
+        return missing, duplicates
+
+    def export_text(self):
+        with self.profiler.stage("export"):
+            return "".join(format_state(state, self.province_index) + "\n" for state in self.registry.states())
+
+    def load_sea_provinces(self, path):
+        is_sea = self.is_sea = read_sea_provinces(path, self.province_index)
+        if self.validator is not None:
+            self.validator.is_sea = is_sea
+        self.coastal = self.adjacency.coastal(is_sea)
+        self.stats.coast = self.adjacency.coast_lengths(is_sea)
+        return is_sea
+
+    def state_info(self, state):
+        provinces = state.province_array()
+        if self.adjacency is None or not len(provinces):
+            return None
+        info = {"parts": len(self.adjacency.components(provinces))}
+        info.update(self.stats.summary(provinces))
+        if self.coastal is not None:
+            info["ports"] = int(self.coastal[provinces].sum())
+            port = state.hubs.get("port")
+            info["port_coastal"] = port is None or bool(self.coastal[port])
+        return info
+
+    def suggest_defaults(self, state):
+        """Arable land in proportion to the state's area (at the ratio of the
+        states already given arable land) and city and port hubs: the province
+        nearest the state's centre and the one with the longest coastline."""
+        provinces = state.province_array()
+        if not len(provinces):
+            return {}
+        ratio = self.stats.arable_land_ratio(s for s in self.registry.states() if s is not state)
+        return {"arable_land": self.stats.suggest_arable_land(provinces, ratio),
+                "city": self.stats.suggest_city(provinces),
+                "port": self.stats.suggest_port(provinces)}
+
+    def apply_suggestions(self, state):
+        """Fill in whichever of arable land, city and port the state lacks, as
+        one undo step. Returns the names filled in."""
+        filled = []
+        self.journal.begin()
+        for name, value in self.suggest_defaults(state).items():
+            if value is None:
+                continue
+            if name == "arable_land" and not state.arable_land:
+                self.registry.set_field(state, name, value)
+                filled.append(name)
+            elif name in ("city", "port") and state.hubs.get(name) is None:
+                self.registry.set_hub(state, name, value)
+                filled.append(name)
+        self.journal.commit()
+        return filled
+
+    def save_project(self, path):
+        """Snapshot the session into the project directory ``path``; from then
+        on every change is appended to its autosave journal."""
+        log = project.save_project(path, self.registry, self.province_index, self.current_state.slot, self.map_path)
+        self.close_project()
+        self.registry.log = log
+        self.project_path = path
+
+    def open_project(self, path, map_path=None):
+        """Load the project's provinces map (or ``map_path``) and restore its
+        states; the map is repainted through the LUT in one pass. The project
+        is read and checked in full before the session is replaced, so a
+        failed open leaves the current session as it was."""
+        map_path = map_path or project.read_project_meta(path)["map"]
+        index = load_province_index(map_path)
+        adjacency, stats = load_adjacency(map_path, index), load_stats(map_path, index)
+        registry, current = project.load_project(path, index)
+
+        self.set_index(index, adjacency, stats)
+        self.map_path = map_path
+        self.registry = registry
+        registry.journal = self.journal
+        self.colors.reserve(self.registry.colors())
+        self.current_state = self.registry.slots[current]
+        self.journal.clear()
+        self.repaint_all()
+        # fold the replayed journal into a fresh snapshot
+        self.save_project(path)
+
+    def close_project(self):
+        if self.registry.log is not None:
+            self.registry.log.close()
+            self.registry.log = None
+        self.project_path = None
+
+    def validate(self):
+        """Start a validation run of the saved states in the background and
+        return its future; once it is done, ``validator.merge(future,
+        registry)`` makes the results available from ``validator.issues()``."""
+        if self.validator is None:
+            self.validator = Validator(self.adjacency, self.province_index.count, self.is_sea)
+        return self.validator.submit(self.registry)
+
+    def next_free_id(self):
+        new_id = 1
+        while new_id in self.registry.by_id:
+            new_id += 1
+        return new_id
@@ -0,0 +1,76 @@
+import re
+
+TOKEN_RE = re.compile(r'#[^\n]*|"[^"]*"|[{}]|[<>!?]?=|[<>]|[^\s{}=<>!?"#]+')
+OPERATORS = {"=", "<", ">", "<=", ">=", "!=", "?="}
+
+
+class ScriptError(ValueError):
+    pass
+
+
+def parse(text):
+    """Parse Paradox script into nested lists.
+
+    A block is a list whose items are either ``(key, value)`` pairs or bare
+    values; a value is a string (quotes stripped) or another block. Repeated
+    keys are kept in order."""
+    root = []
+    stack = [root]
+    key = None
+    for token in TOKEN_RE.findall(text):
+        first = token[0]
+        if first == "#":
+            continue
+        if first == "{":
+            block = []
+            if key is not None:
+                stack[-1].append((key, block))
+                key = None
+            else:
+                stack[-1].append(block)
+            stack.append(block)
+        elif first == "}":
+            if len(stack) == 1:
+                raise ScriptError("unbalanced '}'")
+            stack.pop()
+        elif token in OPERATORS:
+            block = stack[-1]
+            if not block or not isinstance(block[-1], str):
+                raise ScriptError(f"'{token}' without a key")
+            key = block.pop()
+        else:
+            value = token[1:-1] if first == '"' else token
+            if key is not None:
+                stack[-1].append((key, value))
+                key = None
+            else:
+                stack[-1].append(value)
+    if len(stack) != 1:
+        raise ScriptError("unclosed '{'")
+    return root
+
+
+def pairs(block):
+    return [item for item in block if isinstance(item, tuple)]
+
+
+def values(block):
+    return [item for item in block if not isinstance(item, tuple)]
+
+
+def dump_value(value, indent=1):
+    if isinstance(value, str):
+        bare = value in ("yes", "no") or value.lstrip("-").replace(".", "", 1).isdigit()
+        return value if bare else f'"{value}"'
+    if not pairs(value):
+        return "{ " + " ".join(dump_value(item) for item in value) + " }" if value else "{ }"
+    pad = "    " * (indent + 1)
+    lines = [pad + dump_item(item, indent + 1) for item in value]
+    return "{\n" + "\n".join(lines) + "\n" + "    " * indent + "}"
+
+
+def dump_item(item, indent=1):
+    if isinstance(item, tuple):
+        key, value = item
+        return f"{key} = {dump_value(value, indent)}"
+    return dump_value(item, indent)
@@ -0,0 +1,128 @@
+import csv
+import json
+import threading
+from collections import deque
+from time import perf_counter
+
+# upper bounds of the latency histogram buckets, in ms
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, 266, float("inf"))
+
+
+class _Timer:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, perf_counter() - self.start)
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+class Profiler:
+    """Per-stage latency histograms and counters for the painter's hot paths.
+
+    Code wraps a stage in ``with profiler.stage("composite"):`` and bumps
+    counters with ``count``; while disabled both are close to free. Recent
+    stage timings are also kept as trace events for ``export``."""
+
+    def __init__(self, enabled=False, history=20000):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.origin = perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.events = deque(maxlen=history)
+
+    def stage(self, name):
+        return _Timer(self, name) if self.enabled else _NO_TIMER
+
+    def record(self, name, start, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                             "histogram": [0] * len(BUCKETS_MS)}
+            stats["count"] += 1
+            stats["total_ms"] += ms
+            stats["max_ms"] = max(stats["max_ms"], ms)
+            stats["histogram"][next(i for i, bound in enumerate(BUCKETS_MS) if ms <= bound)] += 1
+            self.events.append((name, (start - self.origin) * 1000, ms))
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self.lock:
+            self.origin = perf_counter()
+            self.stages.clear()
+            self.counters.clear()
+            self.events.clear()
+
+    def percentile(self, name, q):
+        """Upper bound of the histogram bucket holding the ``q`` quantile."""
+        stats = self.stages.get(name)
+        if not stats:
+            return None
+        rank, seen = q * stats["count"], 0
+        for bound, n in zip(BUCKETS_MS, stats["histogram"]):
+            seen += n
+            if seen >= rank:
+                return min(bound, stats["max_ms"])
+        return stats["max_ms"]
+
+    def summary(self):
+        with self.lock:
+            stages = {name: dict(stats, mean_ms=stats["total_ms"] / stats["count"])
+                      for name, stats in self.stages.items()}
+            counters = dict(self.counters)
+        for name, stats in stages.items():
+            stats["p50_ms"] = self.percentile(name, 0.5)
+            stats["p95_ms"] = self.percentile(name, 0.95)
+        return {"buckets_ms": [str(bound) for bound in BUCKETS_MS], "stages": stages, "counters": counters}
+
+    def overlay_text(self, extra=None):
+        """One line per stage and counter, then one per ``extra`` section
+        (name -> dict of values)."""
+        summary = self.summary()
+        lines = [f"{name:<20} n={stats['count']:<6} p50={stats['p50_ms']:.2f} "
+                 f"p95={stats['p95_ms']:.2f} max={stats['max_ms']:.2f} ms"
+                 for name, stats in sorted(summary["stages"].items())]
+        lines += [f"{name:<20} {value}" for name, value in sorted(summary["counters"].items())]
+        for name, values in (extra or {}).items():
+            lines.append(f"{name:<20} " + " ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                                                   for key, value in values.items()))
+        return "\n".join(lines)
+
+    def export(self, path, extra=None):
+        """Write the trace events as CSV (``.csv``) or the summary, the
+        ``extra`` sections and the events as JSON (anything else)."""
+        with self.lock:
+            events = list(self.events)
+        if path.lower().endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["stage", "start_ms", "duration_ms"])
+                writer.writerows((name, f"{start:.3f}", f"{ms:.3f}") for name, start, ms in events)
+            return
+        with open(path, "w") as f:
+            json.dump({**self.summary(), **(extra or {}), "events": [{"stage": name, "start_ms": start, "duration_ms": ms}
+                                                    for name, start, ms in events]}, f, indent=1)
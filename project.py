@@ -0,0 +1,118 @@
+import json
+import os
+
+import numpy as np
+
+from states import StateRegistry, state_fields, state_from_fields
+
+VERSION = 1
+
+
+class ProjectLog:
+    """Append-only autosave of a project: one JSON line per registry change
+    (the same entries the undo journal records), so saving an edit costs the
+    size of the edit, not of the map."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(os.path.join(path, "journal.jsonl"), "a", encoding="utf-8")
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def _write_array(path, name, array):
+    temp_path = os.path.join(path, f"{name}.{os.getpid()}.tmp.npy")
+    np.save(temp_path, array)
+    os.replace(temp_path, os.path.join(path, name + ".npy"))
+
+
+def save_project(path, registry, index, current_slot, map_path=None):
+    """Write a full snapshot to the project directory ``path`` and start an
+    empty autosave journal. Returns the ProjectLog to attach to the registry.
+
+    Province lists go into two arrays (per-slot offsets and the concatenated
+    labels, in each state's click order); everything else into project.json."""
+    os.makedirs(path, exist_ok=True)
+    arrays = [state.province_array() if state is not None else np.empty(0, np.int32) for state in registry.slots]
+    offsets = np.zeros(len(arrays) + 1, np.int64)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    _write_array(path, "colors", index.colors)
+    _write_array(path, "offsets", offsets)
+    _write_array(path, "provinces", np.concatenate(arrays))
+
+    meta = {
+        "version": VERSION,
+        "map": os.path.abspath(map_path) if map_path else None,
+        "size": [index.width, index.height],
+        "current": current_slot,
+        "slots": [None if state is None else dict(state_fields(state), saved=registry.is_saved(state))
+                  for state in registry.slots],
+    }
+    temp_path = os.path.join(path, f"project.{os.getpid()}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(temp_path, os.path.join(path, "project.json"))
+    # the snapshot now covers everything the journal held
+    open(os.path.join(path, "journal.jsonl"), "w").close()
+    return ProjectLog(path)
+
+
+def read_project_meta(path):
+    with open(os.path.join(path, "project.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != VERSION:
+        raise ValueError(f"{path}: unsupported project version {meta.get('version')}")
+    return meta
+
+
+def load_project(path, index, journal=None):
+    """Rebuild the registry of a project for ``index``: the snapshot is
+    restored with one vectorized owner assignment, then the autosave journal
+    is replayed. Returns (registry, current slot)."""
+    meta = read_project_meta(path)
+    colors = np.load(os.path.join(path, "colors.npy"))
+    if not np.array_equal(colors, index.colors):
+        raise ValueError(f"{path} was saved for a different provinces map")
+    offsets = np.load(os.path.join(path, "offsets.npy"))
+    provinces = np.load(os.path.join(path, "provinces.npy"))
+
+    registry = StateRegistry(index.count, journal)
+    for slot, fields in enumerate(meta["slots"]):
+        if slot == 0:
+            continue
+        state = state_from_fields(fields) if fields is not None else None
+        if state is not None:
+            state.slot = slot
+            labels = provinces[offsets[slot]:offsets[slot + 1]]
+            state.provinces = dict.fromkeys(labels.tolist())
+            registry.owner[labels] = slot
+            if fields["saved"] and state.state_id is not None:
+                registry.by_id[state.state_id] = state
+        registry.slots.append(state)
+
+    current = meta["current"]
+    with open(os.path.join(path, "journal.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break  # cut off mid-write; everything before it is intact
+            current = replay_entry(registry, json.loads(line), current)
+    registry.touched = set(range(1, len(registry.slots)))
+    return registry, current
+
+
+def replay_entry(registry, entry, current):
+    kind = entry[0]
+    if kind == "add":
+        state = registry.add(state_from_fields(entry[2]))
+        if state.slot != entry[1]:
+            raise ValueError("project journal does not match its snapshot")
+    elif kind == "current":
+        current = entry[2]
+    else:
+        registry.apply(entry)
+    return current
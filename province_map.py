@@ -0,0 +1,183 @@
+import os
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import map_cache
+from tiled_store import STORE_TILE, TiledArray
+
+# maps larger than this (about twice the base game's) keep their labels in a
+# tiled, memory-mapped store unless VSP_TILED=0/1 says otherwise
+TILED_PIXELS = 1 << 26
+
+
+def load_rgb(path):
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def load_province_index(path, tiled=None):
+    """ProvinceIndex of a provinces PNG, served from the on-disk cache when the
+    file has been loaded before (arrays are memory-mapped, not decoded).
+
+    With ``tiled`` (default: for maps over TILED_PIXELS) the label map is
+    cached as tiles, so views and lookups page in only the tiles they touch."""
+    if tiled is None:
+        setting = os.environ.get("VSP_TILED")
+        if setting:
+            tiled = setting == "1"
+        else:
+            with Image.open(path) as image:
+                tiled = image.width * image.height > TILED_PIXELS
+    tile = STORE_TILE if tiled else None
+    arrays = map_cache.cached_arrays(path, "index-tiled" if tiled else "index",
+                                     lambda: ProvinceIndex(load_rgb(path), tile).arrays())
+    return ProvinceIndex.from_arrays(arrays)
+
+
+def pack_rgb(pixels):
+    pixels = np.asarray(pixels)
+    # in place, so a full map costs one int32 array rather than three
+    packed = pixels[..., 0].astype(np.int32)
+    packed <<= 8
+    packed |= pixels[..., 1]
+    packed <<= 8
+    packed |= pixels[..., 2]
+    return packed
+
+
+def parse_code(code):
+    """Packed RGB of a province code such as ``x1A2B3C``, or -1 if it is not
+    a hex colour."""
+    try:
+        return int(code.lstrip("#x"), 16)
+    except ValueError:
+        return -1
+
+
+def unpack_rgb(packed):
+    packed = np.asarray(packed, dtype=np.int32)
+    return np.stack(((packed >> 16) & 0xFF, (packed >> 8) & 0xFF, packed & 0xFF), axis=-1).astype(np.uint8)
+
+
+def build_runs(flat, width, count):
+    boundary = np.empty(flat.size, bool)
+    boundary[0] = True
+    np.not_equal(flat[1:], flat[:-1], out=boundary[1:])
+    boundary[::width] = True
+    starts = np.flatnonzero(boundary)
+    del boundary
+    lengths = np.diff(np.append(starts, flat.size))
+    run_labels = flat[starts]
+
+    order = np.argsort(run_labels, kind="stable")
+    run_starts = starts[order]
+    run_lengths = lengths[order]
+    run_offsets = np.zeros(count + 1, np.int64)
+    np.cumsum(np.bincount(run_labels, minlength=count), out=run_offsets[1:])
+
+    ys = run_starts // width
+    xs = run_starts % width
+    first = run_offsets[:-1]
+    bboxes = np.stack((
+        np.minimum.reduceat(xs, first),
+        ys[first],
+        np.maximum.reduceat(xs + run_lengths, first),
+        ys[run_offsets[1:] - 1] + 1,
+    ), axis=1).astype(np.int32)
+    return {"run_starts": run_starts, "run_lengths": run_lengths, "run_offsets": run_offsets, "bboxes": bboxes}
+
+
+class ProvinceIndex:
+    """Label map of a provinces.png: one int32 label per pixel plus per-province
+    bounding boxes and horizontal pixel runs, so a province can be repainted
+    without scanning the whole image. With ``tile`` set, ``labels`` is a
+    TiledArray."""
+
+    ARRAYS = ("labels", "colors", "run_starts", "run_lengths", "run_offsets", "bboxes")
+
+    def __init__(self, image_array, tile=None):
+        height, width = image_array.shape[:2]
+        packed = pack_rgb(image_array).ravel()
+
+        present = np.zeros(1 << 24, bool)
+        present[packed] = True
+        colors = np.flatnonzero(present).astype(np.int32)
+        del present
+        color_lut = np.zeros(1 << 24, np.int32)
+        color_lut[colors] = np.arange(len(colors), dtype=np.int32)
+        flat = color_lut[packed]
+        del color_lut, packed
+
+        arrays = build_runs(flat, width, len(colors))
+        labels = flat.reshape(height, width)
+        arrays.update(labels=TiledArray.from_array(labels, tile) if tile else labels, colors=colors)
+        self._attach(arrays)
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        index = cls.__new__(cls)
+        index._attach(arrays)
+        return index
+
+    def arrays(self):
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        if isinstance(self.labels, TiledArray):
+            levels = self.labels.chain()
+            arrays.update({f"labels_{i}": level.tiles for i, level in enumerate(levels[1:], 1)})
+            arrays.update(labels=levels[0].tiles, shape=np.array([level.shape for level in levels]))
+        return arrays
+
+    def _attach(self, arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        if self.labels.ndim == 4:
+            # the stored downsampled levels are chained as halves
+            labels = None
+            for i in reversed(range(len(arrays["shape"]))):
+                labels = TiledArray(arrays[f"labels_{i}"] if i else arrays["labels"], arrays["shape"][i], labels)
+            self.labels = labels
+        self.height, self.width = self.labels.shape
+        self.count = len(self.colors)
+        self.rgb = unpack_rgb(self.colors)
+        self._label_of = {c: i for i, c in enumerate(self.colors.tolist())}
+
+    def label_at(self, x, y):
+        return int(self.labels[y, x])
+
+    def label_of(self, hex_code):
+        return self._label_of.get(parse_code(hex_code))
+
+    def labels_of(self, hex_codes):
+        packed = np.array([parse_code(code) for code in hex_codes], np.int64)
+        labels = np.searchsorted(self.colors, packed).astype(np.int32)
+        found = labels < self.count
+        found[found] = self.colors[labels[found]] == packed[found]
+        labels[~found] = -1
+        return labels
+
+    def hex_code(self, label):
+        return "#{:06x}".format(int(self.colors[label]))
+
+    def bbox(self, labels):
+        boxes = self.bboxes[np.atleast_1d(labels)]
+        return (int(boxes[:, 0].min()), int(boxes[:, 1].min()),
+                int(boxes[:, 2].max()), int(boxes[:, 3].max()))
+
+    def labels_in_rect(self, x0, y0, x1, y1):
+        """Provinces with a pixel inside the rectangle (corners inclusive)."""
+        x0, x1 = sorted((max(0, min(x0, x1)), min(self.width - 1, max(x0, x1))))
+        y0, y1 = sorted((max(0, min(y0, y1)), min(self.height - 1, max(y0, y1))))
+        return np.unique(self.labels[y0:y1 + 1, x0:x1 + 1])
+
+    def labels_in_polygon(self, points):
+        """Provinces with a pixel inside the polygon ``[(x, y), ...]``; only the
+        polygon's bounding box of the label map is read."""
+        xs, ys = [int(x) for x, _ in points], [int(y) for _, y in points]
+        x0, y0 = max(0, min(xs)), max(0, min(ys))
+        x1, y1 = min(self.width - 1, max(xs)), min(self.height - 1, max(ys))
+        if x0 > x1 or y0 > y1:
+            return np.empty(0, self.labels.dtype)
+        mask = Image.new("1", (x1 - x0 + 1, y1 - y0 + 1))
+        ImageDraw.Draw(mask).polygon([(x - x0, y - y0) for x, y in zip(xs, ys)], fill=1, outline=1)
+        return np.unique(self.labels[y0:y1 + 1, x0:x1 + 1][np.asarray(mask)])
@@ -0,0 +1,90 @@
+import numpy as np
+
+import map_cache
+
+# arable land per land pixel when no saved state says otherwise
+ARABLE_LAND_PER_PIXEL = 0.002
+
+
+class ProvinceStats:
+    """Area, centroid and bounding box of every province, plus the length of
+    its coastline once the sea provinces are known, so aggregates over a
+    selection never touch pixels."""
+
+    def __init__(self, area, centroids, bboxes, coast=None):
+        self.area = area
+        self.centroids = centroids
+        self.bboxes = bboxes
+        self.coast = coast
+
+    @classmethod
+    def from_index(cls, index):
+        arrays = build_stats(index)
+        return cls(arrays["area"], arrays["centroids"], index.bboxes)
+
+    def summary(self, labels):
+        labels = np.atleast_1d(labels)
+        if not len(labels):
+            return None
+        area = self.area[labels]
+        total = int(area.sum())
+        boxes = self.bboxes[labels]
+        summary = {
+            "provinces": len(labels),
+            "area": total,
+            "centroid": tuple(((self.centroids[labels] * area[:, None]).sum(axis=0) / max(total, 1)).tolist()),
+            "bbox": (int(boxes[:, 0].min()), int(boxes[:, 1].min()), int(boxes[:, 2].max()), int(boxes[:, 3].max())),
+        }
+        if self.coast is not None:
+            summary["coast"] = int(self.coast[labels].sum())
+        return summary
+
+    def suggest_port(self, labels):
+        """The province with the longest coastline, or None if none is coastal."""
+        labels = np.atleast_1d(labels)
+        if self.coast is None or not len(labels) or not self.coast[labels].any():
+            return None
+        return int(labels[np.argmax(self.coast[labels])])
+
+    def suggest_city(self, labels):
+        """The province whose centroid is nearest the selection's centroid."""
+        labels = np.atleast_1d(labels)
+        if not len(labels):
+            return None
+        center = np.array(self.summary(labels)["centroid"])
+        return int(labels[np.argmin(((self.centroids[labels] - center) ** 2).sum(axis=1))])
+
+    def suggest_arable_land(self, labels, per_pixel=ARABLE_LAND_PER_PIXEL):
+        labels = np.atleast_1d(labels)
+        return max(1, int(round(self.area[labels].sum() * per_pixel))) if len(labels) else None
+
+    def arable_land_ratio(self, states):
+        """Arable land per pixel of the states that already have arable land
+        set, falling back to ARABLE_LAND_PER_PIXEL."""
+        arable, area = 0, 0
+        for state in states:
+            if state.arable_land and state.provinces:
+                arable += state.arable_land
+                area += int(self.area[state.province_array()].sum())
+        return arable / area if area else ARABLE_LAND_PER_PIXEL
+
+
+def build_stats(index):
+    """Area and centroid of every province in one bincount pass over the
+    index's horizontal runs (a run of length n starting at x covers the
+    x-coordinates x .. x + n - 1 of a single row)."""
+    lengths = index.run_lengths.astype(np.float64)
+    run_labels = np.repeat(np.arange(index.count), np.diff(index.run_offsets))
+    xs = index.run_starts % index.width
+    ys = index.run_starts // index.width
+
+    area = np.bincount(run_labels, weights=lengths, minlength=index.count)
+    sum_x = np.bincount(run_labels, weights=lengths * (xs + (lengths - 1) / 2), minlength=index.count)
+    sum_y = np.bincount(run_labels, weights=lengths * ys, minlength=index.count)
+    centroids = np.stack((sum_x, sum_y), axis=1) / np.maximum(area, 1)[:, None]
+    return {"area": area.astype(np.int64), "centroids": centroids.astype(np.float32)}
+
+
+def load_stats(path, index):
+    arrays = map_cache.cached_arrays(path, "stats", lambda: build_stats(index))
+    return ProvinceStats(arrays["area"], arrays["centroids"], index.bboxes)
@@ -0,0 +1,249 @@
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageTk
+
+from borders import PROVINCE_EDGE, STATE_EDGE
+from profiler import Profiler
+from tiled_store import TiledArray
+
+TILE_SIZE = 256
+STATE_BORDER_COLOR = (0, 0, 0)
+
+
+class MapPyramid:
+    """Nearest-neighbour downsample pyramid: level n holds every 2**n-th pixel
+    of the read-only base array, so zoomed-out views never sample the full map.
+    A tiled base gets tiled levels, kept in temporary files."""
+
+    def __init__(self, base, min_size=TILE_SIZE * 2):
+        self.levels = [base]
+        while max(self.levels[-1].shape[:2]) > min_size:
+            level = self.levels[-1]
+            if isinstance(level, TiledArray):
+                self.levels.append(level.downsample())
+            else:
+                self.levels.append(np.ascontiguousarray(level[::2, ::2]))
+
+    def level_for(self, scale):
+        level = 0
+        while level + 1 < len(self.levels) and 2 ** (level + 1) * scale <= 1:
+            level += 1
+        return level
+
+
+def tile_span(scale, t, tile_size, limit):
+    u = np.arange(t * tile_size, (t + 1) * tile_size)
+    src = np.floor(u / scale).astype(np.intp)
+    return src[src < limit]
+
+
+def render_tile(level, scale, tx, ty, tile_size=TILE_SIZE):
+    h, w = level.shape[:2]
+    xs = tile_span(scale, tx, tile_size, w)
+    ys = tile_span(scale, ty, tile_size, h)
+    if isinstance(level, TiledArray):
+        return level.grid(ys, xs)
+    return level[ys][:, xs]
+
+
+def composite_tile(pyramid, palette, scale, tx, ty, tile_size=TILE_SIZE, borders=None, border_mode=0):
+    """RGB pixels of tile (tx, ty) at ``scale``: labels sampled from the
+    matching pyramid level and gathered through ``palette``, with the edges
+    in ``border_mode`` drawn from ``borders``. Needs no Tk."""
+    level = pyramid.level_for(scale)
+    step = scale * 2 ** level
+    pixels = palette[render_tile(pyramid.levels[level], step, tx, ty, tile_size)]
+    if border_mode and borders is not None:
+        flags = render_tile(borders.levels[level], step, tx, ty, tile_size) & border_mode
+        pixels[flags == PROVINCE_EDGE] //= 2
+        pixels[(flags & STATE_EDGE) != 0] = STATE_BORDER_COLOR
+    return pixels
+
+
+def view_tiles(shape, scale, origin, view, tile_size=TILE_SIZE):
+    """Tiles covering ``view`` and the ring of tiles just outside it."""
+    cx, cy, cw, ch = view
+    ox, oy = origin
+    h, w = shape[:2]
+    t = tile_size
+    max_tx, max_ty = int(np.ceil(w * scale / t)) - 1, int(np.ceil(h * scale / t)) - 1
+    tx0 = max(0, int((cx + ox) // t))
+    ty0 = max(0, int((cy + oy) // t))
+    tx1 = min(int((cx + ox + cw) // t), max_tx)
+    ty1 = min(int((cy + oy + ch) // t), max_ty)
+
+    visible = {(tx, ty) for tx in range(tx0, tx1 + 1) for ty in range(ty0, ty1 + 1)}
+    ring = {(tx, ty) for tx in range(max(0, tx0 - 1), min(max_tx, tx1 + 1) + 1)
+            for ty in range(max(0, ty0 - 1), min(max_ty, ty1 + 1) + 1)} - visible
+    return visible, ring
+
+
+class TileRenderer:
+    """Draws the map onto a canvas as a grid of screen-space tiles.
+
+    The source is a read-only label array; each tile is produced by one gather
+    through ``palette`` (label -> RGB), so recolouring is a palette edit plus
+    an invalidate of the tiles it overlaps. Tiles are cached per zoom level and
+    panning only creates the tiles that scroll into view. The ring of tiles
+    just outside the view is rendered ahead of time on a worker thread; its
+    results are handed back through a queue and kept only if nothing was
+    invalidated since they were started, checked on the drawing thread.
+
+    With a BorderMask set, the province and/or state edges picked by
+    ``border_mode`` are drawn over each tile as it is composited."""
+
+    def __init__(self, canvas, tile_size=TILE_SIZE, cache_size=256, prefetch=True, profiler=None):
+        self.canvas = canvas
+        self.profiler = profiler or Profiler()
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        self.pyramid = None
+        self.palette = None
+        self.borders = None
+        self.border_mode = 0
+        self.cache = OrderedDict()
+        self.items = {}
+        self.scale = None
+        self.origin = (0, 0)
+        self.executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        self.prepared = {}
+        self.in_flight = set()
+        self.finished = queue.SimpleQueue()
+        self.generation = 0
+
+    def set_source(self, labels, palette):
+        self.pyramid = MapPyramid(labels)
+        self.palette = palette
+        self.borders = None
+        self.clear()
+
+    def set_borders(self, borders, mode):
+        """Draw the edges in ``mode`` (PROVINCE_EDGE | STATE_EDGE, 0 = none)
+        from ``borders``, a BorderMask with one level per pyramid level."""
+        self.borders, self.border_mode = borders, mode
+        self.clear()
+
+    def clear(self):
+        self.canvas.delete("tile")
+        self.cache.clear()
+        self.prepared.clear()
+        self.generation += 1
+        self.items = {}
+        self.scale = None
+
+    def _key(self, scale, tx, ty):
+        return round(scale, 9), tx, ty
+
+    def _tile_image(self, scale, tx, ty):
+        key = self._key(scale, tx, ty)
+        photo = self.cache.get(key)
+        if photo is not None:
+            self.cache.move_to_end(key)
+            return photo
+        pixels = self.prepared.pop(key, None)
+        if pixels is None:
+            pixels = self._render_pixels(scale, tx, ty)
+        else:
+            self.profiler.count("prefetch_hits")
+        with self.profiler.stage("fromarray"):
+            image = Image.fromarray(pixels)
+        with self.profiler.stage("photo"):
+            photo = ImageTk.PhotoImage(image)
+        # Tk keeps a photo as 4 bytes per pixel
+        self.profiler.count("bytes_allocated", image.width * image.height * 4)
+        self.cache[key] = photo
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return photo
+
+    def _render_pixels(self, scale, tx, ty):
+        with self.profiler.stage("composite"):
+            pixels = composite_tile(self.pyramid, self.palette, scale, tx, ty, self.tile_size,
+                                    self.borders, self.border_mode)
+        self.profiler.count("pixels_composited", pixels.shape[0] * pixels.shape[1])
+        self.profiler.count("bytes_allocated", pixels.nbytes)
+        return pixels
+
+    def _prefetch(self, scale, tiles):
+        if self.executor is None:
+            return
+        if len(self.prepared) > self.cache_size:
+            self.prepared.clear()
+        for tx, ty in tiles:
+            key = self._key(scale, tx, ty)
+            if key in self.cache or key in self.prepared or key in self.in_flight:
+                continue
+            self.in_flight.add(key)
+            future = self.executor.submit(self._render_pixels, scale, tx, ty)
+            future.add_done_callback(lambda f, key=key, generation=self.generation: self.finished.put((key, generation, f)))
+
+    def _collect(self):
+        """Take in the tiles the worker has finished since the last draw."""
+        while True:
+            try:
+                key, generation, future = self.finished.get_nowait()
+            except queue.Empty:
+                return
+            self.in_flight.discard(key)
+            if generation == self.generation and future.exception() is None:
+                self.prepared[key] = future.result()
+
+    def draw(self, scale, vec, view):
+        if self.pyramid is None:
+            return
+        self._collect()
+        with self.profiler.stage("draw"):
+            self._draw(scale, vec, view)
+
+    def _draw(self, scale, vec, view):
+        ox, oy = int(round(vec[0] * scale)), int(round(vec[1] * scale))
+
+        if scale != self.scale:
+            self.canvas.delete("tile")
+            self.items = {}
+            self.scale = scale
+        elif (ox, oy) != self.origin:
+            self.canvas.move("tile", self.origin[0] - ox, self.origin[1] - oy)
+        self.origin = (ox, oy)
+
+        t = self.tile_size
+        visible, ring = view_tiles(self.pyramid.levels[0].shape, scale, (ox, oy), view, t)
+        for tile in list(self.items):
+            if tile not in visible:
+                self.canvas.delete(self.items.pop(tile)[0])
+        for tx, ty in visible - self.items.keys():
+            photo = self._tile_image(scale, tx, ty)
+            item = self.canvas.create_image(tx * t - ox, ty * t - oy, anchor="nw", image=photo, tags="tile")
+            self.items[tx, ty] = (item, photo)
+        self._prefetch(scale, ring)
+
+    def _overlaps(self, bbox, scale, tx, ty):
+        x0, y0, x1, y1 = bbox
+        t = self.tile_size
+        f = 2 ** self.pyramid.level_for(scale)
+        # border pixels of level n stand for the 2**n map pixels after them too
+        return (tx * t / scale - f < x1 and x0 < (tx + 1) * t / scale + f
+                and ty * t / scale - f < y1 and y0 < (ty + 1) * t / scale + f)
+
+    def invalidate(self, bbox):
+        if self.pyramid is None:
+            return
+        with self.profiler.stage("invalidate"):
+            self._invalidate(bbox)
+
+    def _invalidate(self, bbox):
+        self.generation += 1
+        self.prepared.clear()
+        for key in list(self.cache):
+            if self._overlaps(bbox, *key):
+                del self.cache[key]
+        if self.scale is None:
+            return
+        for (tx, ty), (item, _) in list(self.items.items()):
+            if self._overlaps(bbox, self.scale, tx, ty):
+                photo = self._tile_image(self.scale, tx, ty)
+                self.canvas.itemconfigure(item, image=photo)
+                self.items[tx, ty] = (item, photo)
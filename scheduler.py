@@ -0,0 +1,63 @@
+from collections import deque
+from time import perf_counter
+
+from profiler import Profiler
+
+
+class FrameScheduler:
+    """Coalesces bursts of view changes into at most one frame per tick.
+
+    Input handlers update the view state and call ``request()``; the render
+    callback then runs once on the Tk event loop, at most every ``interval``
+    ms, so a fast drag never queues a backlog of frames. Latency from the
+    first request to the finished frame is recorded per frame."""
+
+    def __init__(self, root, render, interval=16, history=240, profiler=None):
+        self.root = root
+        self.profiler = profiler or Profiler()
+        self.render = render
+        self.interval = interval
+        self.pending = None
+        self.requested_at = None
+        self.last_frame = 0.0
+        self.frames = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=history)
+
+    def request(self):
+        now = perf_counter()
+        if self.requested_at is None:
+            self.requested_at = now
+        else:
+            self.coalesced += 1
+        if self.pending is None:
+            wait = int(self.interval - (now - self.last_frame) * 1000)
+            self.pending = self.root.after(wait, self._frame) if wait > 0 else self.root.after_idle(self._frame)
+
+    def _frame(self):
+        self.pending = None
+        requested_at, self.requested_at = self.requested_at, None
+        start = perf_counter()
+        with self.profiler.stage("frame"):
+            self.render()
+        self.last_frame = perf_counter()
+        self.frames += 1
+        # every tick the frame overran is a frame the display did not get
+        dropped = int((self.last_frame - start) * 1000 // self.interval)
+        if dropped:
+            self.profiler.count("frames_dropped", dropped)
+        if requested_at is not None:
+            self.latencies.append(self.last_frame - requested_at)
+
+    def stats(self):
+        """Frame counts and input-to-frame latency percentiles."""
+        if not self.latencies:
+            return {"frames": self.frames, "coalesced": self.coalesced}
+        latencies = sorted(self.latencies)
+        return {
+            "frames": self.frames,
+            "coalesced": self.coalesced,
+            "p50_ms": latencies[len(latencies) // 2] * 1000,
+            "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+            "max_ms": latencies[-1] * 1000,
+        }
@@ -0,0 +1,355 @@
+import copy
+
+import numpy as np
+
+import paradox_script
+
+HUB_TYPES = ["city", "port", "farm", "mine", "wood"]
+GOLD_FIELDS = "bg_gold_fields"
+
+
+class State:
+    def __init__(self, state_id=None, name="", color=None):
+        self.state_id = state_id
+        self.name = name
+        self.color = color
+        self.slot = 0
+        self.provinces = {}
+        self.hubs = {}
+        self.subsistence_building = ""
+        self.arable_land = None
+        self.arable_resources = []
+        self.capped_resources = {}
+        self.special_resources = {}
+        self.extra = []
+
+    @property
+    def key(self):
+        return "STATE_" + self.name.strip().replace(' ', '_').upper()
+
+    def province_array(self):
+        return np.fromiter(self.provinces, np.int32, len(self.provinces))
+
+
+class StateRegistry:
+    """All states of a session plus a province -> state index.
+
+    ``owner`` holds, per province label, the slot of the state that owns it
+    (0 = unassigned). Slots are internal and stable, so state IDs can be
+    edited without touching the index. When ``journal`` is set, every change
+    is recorded there as a small undoable entry. ``touched`` collects the
+    slots of changed states until a consumer (the validator) resets it, and
+    ``log`` (a project autosave) receives every change as it is made,
+    including undo/redo."""
+
+    def __init__(self, province_count=0, journal=None):
+        self.owner = np.zeros(province_count, np.int32)
+        self.slots = [None]
+        self.by_id = {}
+        self.journal = journal
+        self.touched = set()
+        self.log = None
+
+    def _touch(self, entry):
+        self.touched.update(entry[2:4] if entry[0] == "owner" else entry[1:2])
+
+    def record(self, entry):
+        self._touch(entry)
+        if self.log is not None:
+            self.log.append(entry)
+        if self.journal is not None:
+            self.journal.record(entry)
+
+    def add(self, state):
+        state.slot = len(self.slots)
+        self.slots.append(state)
+        self.touched.add(state.slot)
+        if self.log is not None:
+            self.log.append(("add", state.slot, state_fields(state)))
+        if state.state_id is not None:
+            self.by_id[state.state_id] = state
+        for label in state.provinces:
+            self.assign(state, label)
+        return state
+
+    def remove(self, state):
+        for label in list(state.provinces):
+            self.unassign(label)
+        if self.is_saved(state):
+            self.save(state, None)
+
+    def save(self, state, state_id):
+        old_id = state.state_id if self.is_saved(state) else None
+        self._set_id(state, state_id)
+        self.record(("id", state.slot, old_id, state_id))
+
+    def _set_id(self, state, state_id):
+        if self.is_saved(state):
+            del self.by_id[state.state_id]
+        state.state_id = state_id
+        if state_id is not None:
+            self.by_id[state_id] = state
+
+    def set_hub(self, state, hub, label):
+        old = state.hubs.get(hub)
+        if old == label:
+            return
+        if label is None:
+            del state.hubs[hub]
+        else:
+            state.hubs[hub] = int(label)
+        self.record(("hub", state.slot, hub, old, label if label is None else int(label)))
+
+    def set_field(self, state, name, value):
+        old = getattr(state, name)
+        if old == value:
+            return
+        setattr(state, name, value)
+        self.record(("field", state.slot, name, copy.copy(old), copy.copy(value)))
+
+    def apply(self, entry, undo=False):
+        """Replay a journal entry forwards or, with ``undo``, backwards.
+        Returns the province label it repainted, if any. A "current" entry
+        (the painter's current state) only reaches the log."""
+        self._touch(entry)
+        kind = entry[0]
+        if kind == "owner":
+            _, label, old, new = entry
+            slot = old if undo else new
+            if slot:
+                self.assign(self.slots[slot], label)
+            else:
+                self.unassign(label)
+            return label
+        if kind == "hub":
+            _, slot, hub, old, new = entry
+            self.set_hub(self.slots[slot], hub, old if undo else new)
+        elif kind == "field":
+            _, slot, name, old, new = entry
+            setattr(self.slots[slot], name, copy.copy(old if undo else new))
+        elif kind == "id":
+            _, slot, old, new = entry
+            self._set_id(self.slots[slot], old if undo else new)
+        if kind in ("field", "id", "current") and self.log is not None:
+            self.log.append(entry[:-2] + (entry[-1], entry[-2]) if undo else entry)
+        return None
+
+    def is_saved(self, state):
+        return state.state_id is not None and self.by_id.get(state.state_id) is state
+
+    def states(self):
+        return list(self.by_id.values())
+
+    def colors(self):
+        return {state.color for state in self.slots[1:] if state is not None}
+
+    def slot_colors(self, slots):
+        """RGB colour of the state in each of ``slots`` (black for slot 0).
+        Only the distinct slots are looked up, so a click costs the same
+        however many states there are."""
+        unique, inverse = np.unique(slots, return_inverse=True)
+        colors = np.zeros((len(unique), 3), np.uint8)
+        for i, slot in enumerate(unique.tolist()):
+            state = self.slots[slot]
+            if state is not None and state.color:
+                colors[i] = [int(state.color[j:j + 2], 16) for j in (1, 3, 5)]
+        return colors[inverse.reshape(-1)]
+
+    def owner_of(self, label):
+        slot = self.owner[label]
+        return self.slots[slot] if slot else None
+
+    def assign(self, state, label):
+        label = int(label)
+        previous = self.owner_of(label)
+        if previous is state:
+            return previous
+        if previous is not None:
+            self._detach(previous, label)
+        self.owner[label] = state.slot
+        state.provinces[label] = None
+        self.record(("owner", label, previous.slot if previous else 0, state.slot))
+        return previous
+
+    def unassign(self, label):
+        label = int(label)
+        previous = self.owner_of(label)
+        if previous is not None:
+            self._detach(previous, label)
+            self.owner[label] = 0
+            self.record(("owner", label, previous.slot, 0))
+        return previous
+
+    def _detach(self, state, label):
+        state.provinces.pop(label, None)
+        for hub, hub_label in list(state.hubs.items()):
+            if hub_label == label:
+                self.set_hub(state, hub, None)
+
+
+def state_fields(state):
+    """Everything about a state except its provinces, as plain JSON values."""
+    return {"state_id": state.state_id, "name": state.name, "color": state.color,
+            "hubs": dict(state.hubs), "subsistence_building": state.subsistence_building,
+            "arable_land": state.arable_land, "arable_resources": list(state.arable_resources),
+            "capped_resources": dict(state.capped_resources), "special_resources": dict(state.special_resources),
+            "extra": "\n".join(paradox_script.dump_item(item) for item in state.extra)}
+
+
+def state_from_fields(fields):
+    state = State(fields["state_id"], fields["name"], fields["color"])
+    state.hubs = {hub: int(label) for hub, label in fields["hubs"].items()}
+    state.subsistence_building = fields["subsistence_building"]
+    state.arable_land = fields["arable_land"]
+    state.arable_resources = list(fields["arable_resources"])
+    state.capped_resources = dict(fields["capped_resources"])
+    state.special_resources = dict(fields["special_resources"])
+    # unknown blocks are kept as script text, which round-trips their structure
+    state.extra = paradox_script.parse(fields["extra"])
+    return state
+
+
+def format_state(state, index, state_id=None):
+    if state_id is None:
+        state_id = state.state_id if state.state_id is not None else ""
+    lines = [f"{state.key} = {{", f"    id = {state_id}"]
+    lines.append(f'    subsistence_building = "{state.subsistence_building}"')
+    provinces = " ".join(f'"{index.hex_code(label)}"' for label in state.provinces)
+    lines.append(f"    provinces = {{ {provinces} }}")
+
+    for hub in HUB_TYPES:
+        if hub in state.hubs:
+            lines.append(f'    {hub} = "{index.hex_code(state.hubs[hub])}"')
+
+    if state.arable_land is not None:
+        lines.append(f"    arable_land = {state.arable_land}")
+    if state.arable_resources:
+        resources = " ".join(f'"{res}"' for res in state.arable_resources)
+        lines.append(f"    arable_resources = {{ {resources} }}")
+    if state.capped_resources:
+        lines.append("    capped_resources = {")
+        lines.extend(f"        {res} = {value}" for res, value in state.capped_resources.items())
+        lines.append("    }")
+
+    for res, amount in state.special_resources.items():
+        lines.append("    resource = {")
+        lines.append(f'        type = "{res}"')
+        if res == GOLD_FIELDS:
+            lines.append('        depleted_type = "bg_gold_mining"')
+        lines.append(f"        undiscovered_amount = {amount}")
+        lines.append("    }")
+
+    lines.extend("    " + paradox_script.dump_item(item) for item in state.extra)
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _scalar(key, field, value):
+    if not isinstance(value, str):
+        raise paradox_script.ScriptError(f"{key}: {field} should be a single value, not a block")
+    return value
+
+
+def _integer(key, field, value):
+    value = _scalar(key, field, value)
+    try:
+        return int(value)
+    except ValueError:
+        raise paradox_script.ScriptError(f"{key}: {field} should be a whole number, not {value!r}") from None
+
+
+def _scalars(key, field, value):
+    """The values of a { } block; a single value counts as a block of one."""
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list):
+        raise paradox_script.ScriptError(f"{key}: {field} should be a {{ }} block")
+    items = paradox_script.values(value)
+    if len(items) != len(value) or not all(isinstance(item, str) for item in items):
+        raise paradox_script.ScriptError(f"{key}: {field} should only list single values")
+    return items
+
+
+def _block(key, field, value):
+    if not isinstance(value, list):
+        raise paradox_script.ScriptError(f"{key}: {field} should be a {{ }} block")
+    return value
+
+
+def state_from_block(key, block):
+    """A State from a parsed state_regions block, with its province and hub
+    codes still unresolved. Raises ScriptError, naming the state, when a known
+    field has the wrong shape."""
+    state = State(name=key[len("STATE_"):] if key.startswith("STATE_") else key)
+    province_codes = []
+    hub_codes = {}
+    for field, value in paradox_script.pairs(block):
+        if field == "id":
+            state.state_id = _integer(key, field, value)
+        elif field == "subsistence_building":
+            state.subsistence_building = _scalar(key, field, value)
+        elif field == "provinces":
+            province_codes = _scalars(key, field, value)
+        elif field in HUB_TYPES:
+            hub_codes[field] = _scalar(key, field, value)
+        elif field == "arable_land":
+            state.arable_land = _integer(key, field, value)
+        elif field == "arable_resources":
+            state.arable_resources = _scalars(key, field, value)
+        elif field == "capped_resources":
+            state.capped_resources = {res: _scalar(key, res, amount)
+                                      for res, amount in paradox_script.pairs(_block(key, field, value))}
+        elif field == "resource":
+            resource = dict(paradox_script.pairs(_block(key, field, value)))
+            if ({"type", "undiscovered_amount"} <= resource.keys() <= {"type", "depleted_type", "undiscovered_amount"}
+                    and all(isinstance(item, str) for item in resource.values())):
+                state.special_resources[resource["type"]] = resource["undiscovered_amount"]
+            else:
+                state.extra.append((field, value))
+        else:
+            state.extra.append((field, value))
+    return state, province_codes, hub_codes
+
+
+def read_state_files(paths, index):
+    """Parse state_regions files and resolve their province codes against
+    ``index`` in one vectorized lookup. Returns the states (provinces and hubs
+    filled in with labels) and the province codes that are not on the map."""
+    parsed = []
+    for path in paths:
+        with open(path, encoding="utf-8-sig") as f:
+            for key, block in paradox_script.pairs(paradox_script.parse(f.read())):
+                if isinstance(block, list):
+                    parsed.append(state_from_block(key, block))
+
+    codes = [code for _, province_codes, hub_codes in parsed for code in (*province_codes, *hub_codes.values())]
+    labels = index.labels_of(codes)
+    missing = [code for code, label in zip(codes, labels) if label < 0]
+
+    states = []
+    position = 0
+    for state, province_codes, hub_codes in parsed:
+        province_labels = labels[position:position + len(province_codes)]
+        position += len(province_codes)
+        state.provinces = dict.fromkeys(province_labels[province_labels >= 0].tolist())
+        for hub in hub_codes:
+            if labels[position] >= 0:
+                state.hubs[hub] = int(labels[position])
+            position += 1
+        states.append(state)
+    return states, missing
+
+
+def find_duplicates(states):
+    """Provinces listed by more than one of ``states`` and state IDs used more
+    than once, as {label: [state keys]} and {id: [state keys]}. The registry
+    keeps one owner per province and one state per ID, so these would be
+    silently dropped on import."""
+    by_label, by_id = {}, {}
+    for state in states:
+        for label in state.provinces:
+            by_label.setdefault(label, []).append(state.key)
+        if state.state_id is not None:
+            by_id.setdefault(state.state_id, []).append(state.key)
+    return ({label: keys for label, keys in by_label.items() if len(keys) > 1},
+            {state_id: keys for state_id, keys in by_id.items() if len(keys) > 1})
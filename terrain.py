@@ -0,0 +1,116 @@
+import numpy as np
+
+import paradox_script
+from province_map import load_rgb, pack_rgb
+
+TERRAIN_TYPES = ["plains", "forest", "hills", "mountain", "desert", "jungle", "wetland",
+                 "tundra", "snow", "savanna", "lakes", "ocean"]
+MAX_CLASSES = 256
+# a province whose majority class covers less than this is worth a look
+MIXED_SHARE = 0.5
+
+
+def classify_mask(labels, count, mask, band=512):
+    """Majority terrain-mask colour of every province.
+
+    One 2-D bincount of (province label, mask class) per band of rows; the
+    counts are summed across bands to bound the temporaries. Returns the
+    class colours (packed RGB), the majority class per province (-1 for none)
+    and the share of the province's pixels it covers."""
+    if mask.shape[:2] != labels.shape:
+        raise ValueError(f"terrain mask is {mask.shape[1]}x{mask.shape[0]}, "
+                         f"the provinces map {labels.shape[1]}x{labels.shape[0]}")
+    packed = pack_rgb(mask)
+    present = np.zeros(1 << 24, bool)
+    present[packed.ravel()] = True
+    colors = np.flatnonzero(present).astype(np.int32)
+    del present
+    if len(colors) > MAX_CLASSES:
+        raise ValueError(f"terrain mask has {len(colors)} colours; expected at most {MAX_CLASSES} terrain classes")
+    class_lut = np.zeros(1 << 24, np.int32)
+    class_lut[colors] = np.arange(len(colors), dtype=np.int32)
+
+    classes = len(colors)
+    key_type = np.int32 if count * classes < 2 ** 31 else np.int64
+    counts = np.zeros(count * classes, np.int64)
+    for y in range(0, labels.shape[0], band):
+        keys = labels[y:y + band].ravel().astype(key_type) * classes + class_lut[packed[y:y + band].ravel()]
+        counts += np.bincount(keys, minlength=count * classes)
+    counts = counts.reshape(count, classes)
+
+    majority = counts.argmax(axis=1).astype(np.int32)
+    totals = counts.sum(axis=1)
+    share = counts[np.arange(count), majority] / np.maximum(totals, 1)
+    majority[totals == 0] = -1
+    return colors, majority, share.astype(np.float32)
+
+
+def load_mask(path, index):
+    return classify_mask(index.labels, index.count, load_rgb(path))
+
+
+class TerrainMap:
+    """Terrain of every province: the majority class of a terrain mask mapped
+    to a terrain type, with per-province edits on top."""
+
+    def __init__(self, count):
+        self.count = count
+        self.class_colors = np.empty(0, np.int32)
+        self.majority = np.full(count, -1, np.int32)
+        self.share = np.zeros(count, np.float32)
+        self.class_terrain = []
+        self.overrides = {}
+
+    def set_classes(self, colors, majority, share):
+        self.class_colors, self.majority, self.share = colors, majority, share
+        self.class_terrain = [None] * len(colors)
+
+    def set_class_terrain(self, cls, terrain):
+        self.class_terrain[cls] = terrain
+
+    def set(self, label, terrain):
+        self.overrides[int(label)] = terrain
+
+    def terrain_of(self, label):
+        label = int(label)
+        if label in self.overrides:
+            return self.overrides[label]
+        cls = self.majority[label]
+        return self.class_terrain[cls] if cls >= 0 else None
+
+    def class_provinces(self):
+        return np.bincount(self.majority[self.majority >= 0], minlength=len(self.class_colors))
+
+    def class_mixed(self, below=MIXED_SHARE):
+        """Per class, the provinces it is the majority of but covers less
+        than ``below`` of."""
+        mixed = (self.majority >= 0) & (self.share < below)
+        return np.bincount(self.majority[mixed], minlength=len(self.class_colors))
+
+    def terrains(self):
+        """Terrain name of every province (None where unset)."""
+        names = np.array(self.class_terrain + [None], object)[self.majority]
+        for label, terrain in self.overrides.items():
+            names[label] = terrain
+        return names
+
+
+def read_province_terrains(path, index, terrain_map):
+    """Apply a province_terrains.txt (``x1A2B3C = "plains"`` lines) as
+    per-province edits. Returns the province codes not on the map."""
+    with open(path, encoding="utf-8-sig") as f:
+        entries = [(key, value) for key, value in paradox_script.pairs(paradox_script.parse(f.read()))
+                   if isinstance(value, str)]
+    labels = index.labels_of([key for key, _ in entries])
+    for label, (_, terrain) in zip(labels.tolist(), entries):
+        if label >= 0:
+            terrain_map.set(label, terrain)
+    return [key for label, (key, _) in zip(labels, entries) if label < 0]
+
+
+def write_province_terrains(path, index, terrain_map):
+    names = terrain_map.terrains()
+    labels = np.flatnonzero(np.not_equal(names, None))
+    with open(path, "w") as f:
+        f.writelines(f'x{color:06X}="{terrain}"\n' for color, terrain in zip(index.colors[labels].tolist(), names[labels]))
+    return len(labels)
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import paradox_script
+from borders import PROVINCE_EDGE, STATE_EDGE, BorderMask
+from painter_core import PainterCore
+from province_map import load_province_index, load_rgb, pack_rgb
+from renderer import MapPyramid, composite_tile
+from states import State, format_state, read_state_files, state_fields
+from vsp_bench import synthetic_map
+
+
+@pytest.fixture(scope="module")
+def map_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("map") / "provinces.png"
+    Image.fromarray(synthetic_map(300, 512, 256)).save(path)
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    monkeypatch.setenv("VSP_CACHE_DIR", str(tmp_path_factory.getbasetemp() / "cache"))
+
+
+@pytest.fixture
+def core(map_path):
+    core = PainterCore()
+    core.load_map(map_path)
+    yield core
+    core.close_project()
+
+
+def test_runs_and_bboxes(map_path):
+    index = load_province_index(map_path, tiled=False)
+    packed = pack_rgb(load_rgb(map_path))
+    assert np.array_equal(index.colors[index.labels], packed)
+
+    rebuilt = np.full(index.width * index.height, -1, np.int64)
+    for label in range(index.count):
+        runs = slice(index.run_offsets[label], index.run_offsets[label + 1])
+        for start, length in zip(index.run_starts[runs].tolist(), index.run_lengths[runs].tolist()):
+            assert (rebuilt[start:start + length] == -1).all()
+            rebuilt[start:start + length] = label
+        ys, xs = np.nonzero(index.labels == label)
+        assert index.bboxes[label].tolist() == [xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]
+    assert np.array_equal(rebuilt.reshape(index.labels.shape), index.labels)
+
+
+def test_script_round_trip():
+    text = """
+STATE_A = {
+    id = 1
+    provinces = { "x000001" "x0000FF" }
+    resource = { type = "bg_coal_mining" undiscovered_amount = 10 }
+    traits = { state_trait_a }
+    flag = yes
+}
+"""
+    parsed = paradox_script.parse(text)
+    dumped = "\n".join(paradox_script.dump_item(item, 0) for item in parsed)
+    assert paradox_script.parse(dumped) == parsed
+
+
+def test_read_state_files(map_path, tmp_path):
+    index = load_province_index(map_path)
+    state = State(7, "TEST_LAND")
+    state.provinces = dict.fromkeys([5, 3, 9])
+    state.hubs = {"city": 3, "port": 9}
+    state.arable_land = 12
+    state.arable_resources = ["bg_rye_farms"]
+    state.capped_resources = {"bg_logging": "4"}
+    state.extra = [("traits", ["state_trait_a"])]
+    path = tmp_path / "states.txt"
+    path.write_text(format_state(state, index) + 'STATE_B = { id = 8 provinces = { "x0A0B0C" } }\n')
+
+    (read, other), missing = read_state_files([str(path)], index)
+    assert state_fields(read) == state_fields(state)
+    assert list(read.provinces) == [5, 3, 9]
+    assert other.state_id == 8 and not other.provinces
+    assert missing == ["x0A0B0C"]
+
+
+def test_read_state_files_rejects_blocks(map_path, tmp_path):
+    path = tmp_path / "states.txt"
+    path.write_text("STATE_A = { id = { 1 } }\n")
+    with pytest.raises(paradox_script.ScriptError, match="STATE_A"):
+        read_state_files([str(path)], load_province_index(map_path))
+
+
+def test_undo_redo(core):
+    first = core.current_state
+    core.select_provinces(np.arange(10))
+    core.toggle_province(3)
+    core.save_current_state(1)
+    second = core.current_state
+    core.toggle_province(3)
+    core.toggle_province(20, reassign=True)
+    after = core.registry.owner.copy()
+
+    assert core.undo() and core.undo()
+    assert core.registry.owner[20] == 0 and core.registry.owner[3] == 0
+    assert core.undo()
+    assert core.current_state is first and first.state_id is None
+    assert core.undo() and core.undo()
+    assert not core.registry.owner.any()
+    assert np.array_equal(core.display_colors, core.province_index.rgb)
+
+    while core.redo():
+        pass
+    assert np.array_equal(core.registry.owner, after)
+    assert core.current_state is second and first.state_id == 1
+    owned = core.registry.owner > 0
+    assert (core.display_colors[owned] != core.province_index.rgb[owned]).any()
+
+
+def test_project_reopen(core, tmp_path):
+    core.select_provinces(np.arange(0, 40, 2))
+    core.registry.set_field(core.current_state, "name", "north")
+    core.save_current_state(4)
+    core.save_project(str(tmp_path))
+    # changes after the snapshot go through the autosave journal
+    core.toggle_province(50)
+    core.change_color()
+    core.undo()
+
+    reopened = PainterCore()
+    reopened.open_project(str(tmp_path))
+    try:
+        assert np.array_equal(reopened.registry.owner, core.registry.owner)
+        assert reopened.registry.by_id.keys() == core.registry.by_id.keys()
+        assert [None if s is None else state_fields(s) for s in reopened.registry.slots] == \
+               [None if s is None else state_fields(s) for s in core.registry.slots]
+        assert reopened.current_state.slot == core.current_state.slot
+        assert np.array_equal(reopened.display_colors, core.display_colors)
+    finally:
+        reopened.close_project()
+
+
+@pytest.mark.parametrize("border_mode", [0, PROVINCE_EDGE | STATE_EDGE])
+def test_tiled_rendering(core, map_path, border_mode):
+    core.select_provinces(np.arange(0, 300, 3))
+    tiled = load_province_index(map_path, tiled=True)
+    plain = load_province_index(map_path, tiled=False)
+    assert np.array_equal(np.asarray(tiled.labels), plain.labels)
+
+    pyramids = [MapPyramid(index.labels, 64) for index in (tiled, plain)]
+    masks = [BorderMask(index.labels, core.registry.owner, len(pyramid.levels))
+             for index, pyramid in zip((tiled, plain), pyramids)]
+    for scale in (0.2, 0.5, 1, 3):
+        for tx in range(int(np.ceil(512 * scale / 64))):
+            for ty in range(int(np.ceil(256 * scale / 64))):
+                a, b = (composite_tile(pyramid, core.display_colors, scale, tx, ty, 64, mask, border_mode)
+                        for pyramid, mask in zip(pyramids, masks))
+                assert np.array_equal(a, b), (scale, tx, ty)
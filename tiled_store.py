@@ -0,0 +1,147 @@
+import tempfile
+
+import numpy as np
+
+import map_cache
+
+STORE_TILE = 256
+
+
+class TiledArray:
+    """2-D array kept as a grid of square tiles, shape (rows, cols, tile, tile),
+    normally memory-mapped from disk.
+
+    A window read (``array[y0:y1, x0:x1]``), a pixel lookup or a gather of
+    rows x columns (``grid``) pages in only the tiles it overlaps, so resident
+    memory follows what is being looked at rather than the size of the map.
+    Indexing supports what the painter needs: ints and step-1 slices.
+
+    ``half`` is the array downsampled by two, when it has been stored too."""
+
+    ndim = 2
+
+    def __init__(self, tiles, shape, half=None):
+        self.tiles = tiles
+        self.shape = tuple(int(n) for n in shape)
+        self.tile = tiles.shape[2]
+        self.dtype = tiles.dtype
+        self.half = half
+
+    @classmethod
+    def from_array(cls, array, tile=STORE_TILE):
+        """Tiled copy of a 2-D array, in memory (to be saved as .npy), with
+        its downsampled halves down to a single tile."""
+        tiled = cls._from_array(array, tile)
+        level = tiled
+        while max(array.shape) > tile:
+            array = array[::2, ::2]
+            level.half = cls._from_array(array, tile)
+            level = level.half
+        return tiled
+
+    def chain(self):
+        """This array followed by its stored halves."""
+        levels = [self]
+        while levels[-1].half is not None:
+            levels.append(levels[-1].half)
+        return levels
+
+    @classmethod
+    def _from_array(cls, array, tile):
+        height, width = array.shape
+        rows, cols = -(-height // tile), -(-width // tile)
+        tiles = np.zeros((rows, cols, tile, tile), array.dtype)
+        band = np.zeros((tile, cols * tile), array.dtype)
+        for row in range(rows):
+            block = array[row * tile:(row + 1) * tile]
+            band[:len(block), :width] = block
+            band[len(block):] = 0
+            tiles[row] = band.reshape(tile, cols, tile).swapaxes(0, 1)
+        return cls(tiles, (height, width))
+
+    @classmethod
+    def empty(cls, shape, dtype, tile=STORE_TILE):
+        """Zeroed array backed by an unlinked temporary file in the cache
+        directory, so the OS can page it out like the mapped map itself."""
+        rows, cols = -(-shape[0] // tile), -(-shape[1] // tile)
+        with tempfile.TemporaryFile(dir=map_cache.cache_dir()) as f:
+            tiles = np.memmap(f, dtype, "w+", shape=(rows, cols, tile, tile))
+        return cls(tiles, shape)
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    def _span(self, key, length):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(length)
+            if step != 1:
+                raise IndexError("tiled arrays only support step-1 slices")
+            return start, max(start, stop), False
+        key = int(key)
+        if key < 0:
+            key += length
+        if not 0 <= key < length:
+            raise IndexError(f"index {key} is out of bounds for size {length}")
+        return key, key + 1, True
+
+    def _blocks(self, y0, y1, x0, x1):
+        """(tile index, window of that tile, window of the output) for every
+        tile overlapping rows y0..y1 and columns x0..x1 (exclusive ends)."""
+        if y1 <= y0 or x1 <= x0:
+            return
+        t = self.tile
+        for ty in range(y0 // t, (y1 - 1) // t + 1):
+            a, b = max(y0, ty * t), min(y1, (ty + 1) * t)
+            for tx in range(x0 // t, (x1 - 1) // t + 1):
+                c, d = max(x0, tx * t), min(x1, (tx + 1) * t)
+                yield ((ty, tx, slice(a - ty * t, b - ty * t), slice(c - tx * t, d - tx * t)),
+                       (slice(a - y0, b - y0), slice(c - x0, d - x0)))
+
+    def _window(self, key):
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        y0, y1, drop_y = self._span(rows, self.shape[0])
+        x0, x1, drop_x = self._span(cols, self.shape[1])
+        return y0, y1, x0, x1, drop_y, drop_x
+
+    def __getitem__(self, key):
+        y0, y1, x0, x1, drop_y, drop_x = self._window(key)
+        if drop_y and drop_x:
+            t = self.tile
+            return self.tiles[y0 // t, x0 // t, y0 % t, x0 % t]
+        out = np.empty((y1 - y0, x1 - x0), self.dtype)
+        for source, target in self._blocks(y0, y1, x0, x1):
+            out[target] = self.tiles[source]
+        if drop_y:
+            return out[0]
+        return out[:, 0] if drop_x else out
+
+    def __setitem__(self, key, value):
+        y0, y1, x0, x1, _, _ = self._window(key)
+        value = np.broadcast_to(np.asarray(value, self.dtype), (y1 - y0, x1 - x0))
+        for target, source in self._blocks(y0, y1, x0, x1):
+            self.tiles[target] = value[source]
+
+    def __array__(self, dtype=None, copy=None):
+        # the whole map at once, for batch code that needs it anyway
+        array = self[:, :]
+        return array if dtype is None else array.astype(dtype)
+
+    def grid(self, ys, xs):
+        """``array[ys][:, xs]`` for integer arrays ys and xs."""
+        t = self.tile
+        return self.tiles[(ys // t)[:, None], (xs // t)[None, :], (ys % t)[:, None], (xs % t)[None, :]]
+
+    def downsample(self):
+        """Every second pixel in both directions, as a tiled array: the stored
+        half if there is one, else computed into a temporary file."""
+        if self.half is not None:
+            return self.half
+        height, width = self.shape
+        half = TiledArray.empty(((height + 1) // 2, (width + 1) // 2), self.dtype, self.tile)
+        xs = np.arange(0, width, 2)
+        for y in range(0, half.shape[0], self.tile):
+            ys = np.arange(y, min(y + self.tile, half.shape[0])) * 2
+            half[y:y + len(ys), :] = self.grid(ys, xs)
+        self.half = half
+        return half
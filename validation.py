@@ -0,0 +1,144 @@
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from adjacency import AdjacencyGraph
+
+_graph = None
+
+
+def _init_worker(indptr, indices):
+    global _graph
+    _graph = AdjacencyGraph(indptr, indices)
+
+
+def state_components(graph, member):
+    """Connected parts of each state, found for all states at once.
+
+    ``member`` holds a state number per province (-1 = not checked). Every
+    province starts as its own component and repeatedly takes the smallest
+    component of a same-state neighbour, with pointer jumping, until nothing
+    changes. Returns the number of parts per state number."""
+    sources = graph.edge_sources()
+    keep = (member[sources] >= 0) & (member[sources] == member[graph.indices])
+    sources, targets = sources[keep], graph.indices[keep].astype(np.intp)
+    component = np.arange(len(member))
+    while True:
+        updated = component.copy()
+        np.minimum.at(updated, sources, component[targets])
+        updated = updated[updated]
+        if np.array_equal(updated, component):
+            break
+        component = updated
+
+    checked = np.flatnonzero(member >= 0)
+    pairs = np.unique(member[checked].astype(np.int64) << 32 | component[checked])
+    return np.bincount((pairs >> 32).astype(np.intp), minlength=int(member.max()) + 1 if len(checked) else 0)
+
+
+def validate(snapshot, graph=None):
+    """Run every check over a snapshot of the saved states (see
+    ``Validator.snapshot``). Cross-state checks cover all states; the
+    per-state checks only the states listed in ``snapshot["touched"]``.
+    Returns (global issues, {slot: issues})."""
+    graph = graph or _graph
+    count = snapshot["count"]
+    slots, keys = snapshot["slots"], snapshot["keys"]
+    offsets, provinces = snapshot["offsets"], snapshot["provinces"]
+
+    issues = []
+    listed = np.bincount(provinces, minlength=count)
+    unassigned = listed == 0
+    if snapshot.get("is_sea") is not None:
+        unassigned &= ~snapshot["is_sea"]
+    if unassigned.any():
+        issues.append({"check": "unassigned provinces", "states": [], "provinces": np.flatnonzero(unassigned).tolist()})
+
+    # no duplicate province or ID checks: the registry keeps one owner per
+    # province and one state per ID; imports report them instead
+    issues += [{"check": "name collision", "states": [key] * n, "provinces": []}
+               for key, n in Counter(keys).items() if n > 1]
+
+    touched = [i for i, slot in enumerate(slots) if slot in snapshot["touched"]]
+    member = np.full(count, -1, np.int32)
+    for i in touched:
+        member[provinces[offsets[i]:offsets[i + 1]]] = i
+    parts = state_components(graph, member)
+
+    per_state = {slots[i]: [] for i in touched}
+    for i in touched:
+        own = provinces[offsets[i]:offsets[i + 1]]
+        if i < len(parts) and parts[i] > 1:
+            per_state[slots[i]].append({"check": "non-contiguous state", "states": [keys[i]],
+                                        "provinces": [], "parts": int(parts[i])})
+        outside = [label for hub, label in snapshot["hubs"][i].items() if not np.any(own == label)]
+        if outside:
+            per_state[slots[i]].append({"check": "hub outside state", "states": [keys[i]], "provinces": outside})
+    return issues, per_state
+
+
+class Validator:
+    """Whole-map checks of the saved states, run in a worker process.
+
+    The adjacency graph is sent to the worker once; each run sends the state
+    list and re-runs the per-state checks (contiguity, hubs) only for the
+    states the registry marked as touched since the previous run."""
+
+    def __init__(self, adjacency, count, is_sea=None):
+        self.count = count
+        self.is_sea = is_sea
+        # spawn, not fork: forking the Tk process copies its threads and locks
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_init_worker,
+                                            initargs=(np.asarray(adjacency.indptr), np.asarray(adjacency.indices)))
+        self.global_issues = []
+        self.per_state = {}
+        self.checked = set()
+        self.pending = None
+
+    def snapshot(self, registry):
+        states = registry.states()
+        arrays = [state.province_array() for state in states]
+        offsets = np.zeros(len(states) + 1, np.int64)
+        np.cumsum([len(a) for a in arrays], out=offsets[1:])
+        slots = [state.slot for state in states]
+        touched = registry.touched | (set(slots) - self.checked)
+        registry.touched = set()
+        return {
+            "count": self.count,
+            "is_sea": self.is_sea,
+            "slots": slots,
+            "keys": [state.key for state in states],
+            "hubs": [dict(state.hubs) for state in states],
+            "offsets": offsets,
+            "provinces": np.concatenate(arrays) if arrays else np.empty(0, np.int32),
+            "touched": touched,
+        }
+
+    def submit(self, registry):
+        """Start a run; pass the future to ``merge`` once it is done."""
+        self.pending = self.snapshot(registry)
+        return self.executor.submit(validate, self.pending)
+
+    def merge(self, future, registry):
+        """Fold a finished run into ``issues()``. Called on the thread that
+        edits the registry, since a failed run hands its states back to
+        ``registry.touched``."""
+        snapshot, self.pending = self.pending, None
+        if future.cancelled() or future.exception() is not None:
+            # check these states again next time
+            registry.touched |= snapshot["touched"]
+            return
+        self.global_issues, per_state = future.result()
+        live = set(snapshot["slots"])
+        self.per_state = {slot: issues for slot, issues in self.per_state.items() if slot in live}
+        self.per_state.update(per_state)
+        self.checked = (self.checked & live) | set(per_state)
+
+    def issues(self):
+        return self.global_issues + [issue for issues in self.per_state.values() for issue in issues]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,505 +1,964 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
-import cv2
-import numpy as np
-import random
-
-class VicStatePainter:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("State Painter")
-        self.root.geometry("1800x1000")
-        self.image = None
-        self.image_array = None
-        self.original_image_array = None
-
-        self.x = 0
-        self.y = 0   
-        self.state_id = 1
-        self.zoom_in = 0
-        self.max_zoom = 1
-        self.click = False
-
-        self.scale = 1
-        self.p_scale = 1
-        self.delta = 1.3
-
-        self.width = 8192
-        self.height = 3616 
-
-        self.vec = [0,0]
-
-        self.state_data = ""
-        self.state_colors = {}
-        self.all_states = []
-        self.hex_codes = []
-        self.current_state_color = self.generate_random_color()
-        self.highlighted_provinces = set()
-        self.used_state_ids = set()
-
-        self.special_assignments = {"city": None, "port": None, "farn": None, "mine": None, "wood": None}
-        self.current_assignment = None
-        
-        self.create_widgets()
-
-    def choose_image(self):
-        file_path = filedialog.askopenfilename(filetypes=[("PNG files", "*.png")])
-        self.image = Image.open(file_path)
-        self.width, self.height = self.image.size
-        self.image_array = np.array(self.image)
-        self.original_image_array = self.image_array.copy()
-        self.update_image()
-
-    def update_image(self, event = None):
-
-        cx, cy = self.canvas.canvasx(0), self.canvas.canvasy(0)
-        cw, ch = self.canvas.winfo_width(), self.canvas.winfo_height()
-        endx, endy = int(cw / self.scale), int(ch / self.scale)
-
-        if(self.zoom_in != 0):  
-            currX = int(self.x / self.p_scale) + self.vec[0]
-            currY = int(self.y / self.p_scale) + self.vec[1]
-
-            self.vec[0] = int(currX - (self.x / self.scale))
-            self.vec[1] = int(currY - (self.y / self.scale))
-        if(self.click):
-            self.image = Image.fromarray(self.image_array)
-
-        self.vec[0] =  max(0, self.vec[0])
-        self.vec[1] =  max(0, self.vec[1])
-
-        ddx = (endx + self.vec[0]) - self.image.width
-        ddy = (endy + self.vec[1])  - self.image.height
-
-        if(ddx > 0):
-            self.vec[0] = self.vec[0] - ddx
-        if(ddy > 0):
-            self.vec[1] = self.vec[1] - ddy
-
-        newX = self.vec[0] + (cx / self.scale)
-        newY = self.vec[1] + (cy / self.scale)
-        visible_img = self.image.crop((newX, newY, newX + endx, newY + endy))
-        visible_img = visible_img.resize((cw, ch), Image.NEAREST)
-    
-        self.tk_image = ImageTk.PhotoImage(visible_img)
-        self.canvas.delete("all")
-        self.canvas.create_image(cx, cy, anchor="nw", image=self.tk_image)
-
-        self.canvas.configure(scrollregion=(-cw, -ch, (self.width * self.scale), (self.height * self.scale)))
-        
-
-    def flood_fill(self, x, y):
-        cv2.floodFill(self.image_array, None, (x, y), self.hex_to_rgb(self.current_state_color), 
-                      loDiff=(0, 0, 0), upDiff=(0, 0, 0))
-
-    def remove_highlight(self, x, y):
-        mask = np.zeros((self.image_array.shape[0] + 2, self.image_array.shape[1] + 2), np.uint8)      
-        cv2.floodFill(self.original_image_array, mask, (x, y), (255, 255, 255), 
-                      loDiff=(0, 0, 0), upDiff=(0, 0, 0), flags=cv2.FLOODFILL_MASK_ONLY) 
-        flood_mask = mask[1:-1, 1:-1]
-        self.image_array[flood_mask > 0] = self.original_image_array[flood_mask > 0]
-
-    def on_click(self, event):
-        self.click = True
-
-        self.zoom_in = 0
-        self.x = self.canvas.canvasx(event.x)
-        self.y = self.canvas.canvasy(event.y)
-        image_x = int(self.x / self.scale) + self.vec[0]
-        image_y = int(self.y / self.scale) + self.vec[1]
-
-        if 0 <= image_x < self.image_array.shape[1] and 0 <= image_y < self.image_array.shape[0]:
-            visible_color = self.rgb_to_hex(self.image_array[image_y, image_x])
-            for state_id in self.used_state_ids:
-                state_color = self.state_colors.get(state_id)
-                if state_color is not None and state_color == visible_color:
-                    return  
-
-            clicked_color = self.original_image_array[image_y, image_x]
-            hex_code = '#{:02x}{:02x}{:02x}'.format(*clicked_color)
-
-
-            if hex_code in self.highlighted_provinces:
-                self.highlighted_provinces.remove(hex_code)
-                for key, entry in self.special_assignments.items():
-                    if entry is not None:
-                        entry_value = entry.get()
-                        if entry_value == hex_code:
-                            entry.delete(0, tk.END)
-                            self.special_assignments[key] = None
-                            break
-                self.hex_codes.remove(hex_code)
-                self.remove_highlight(image_x, image_y)
-            elif self.current_assignment:
-                for key, entry in self.special_assignments.items():
-                    if entry is not None:
-                        entry_value = entry.get()
-                        if entry_value == hex_code:
-                            entry.delete(0, tk.END)
-                            self.special_assignments[key] = None
-                            break
-                self.special_assignments[self.current_assignment].delete(0, tk.END)
-                self.special_assignments[self.current_assignment].insert(0, hex_code)
-                self.highlighted_provinces.add(hex_code)
-                self.current_assignment = None
-                self.hex_codes.append(hex_code)
-                self.flood_fill(image_x, image_y)
-            else:
-                self.highlighted_provinces.add(hex_code)
-                self.hex_codes.append(hex_code)
-                self.flood_fill(image_x, image_y)
-
-            self.update_provinces_text()
-            self.update_image()
-
-    def move_from(self, event):
-        self.x = self.canvas.canvasx(event.x)
-        self.y = self.canvas.canvasy(event.y)
-        self.zoom_in = 0
-        self.click = False
-        self.canvas.scan_mark(event.x, event.y)
-
-    def move_to(self, event):
-        self.x = self.canvas.canvasx(event.x)
-        self.y = self.canvas.canvasy(event.y)
-        self.zoom_in = 0
-        self.canvas.scan_dragto(event.x, event.y, gain=1)
-        
-        self.update_image()
-
-    def wheel(self, event):
-        self.click = False
-        self.max_zoom = max(self.canvas.winfo_width() / self.width, self.canvas.winfo_height() / self.height)
-
-        self.x, self.y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        self.zoom_in = event.delta if event.delta else 0
-
-        if self.zoom_in != 0:
-            self.p_scale = self.scale
-            self.scale *= self.delta if self.zoom_in > 0 else 1/self.delta
-            self.scale = max(self.scale, self.max_zoom)
-            self.scale = min(self.scale, max(self.canvas.winfo_width(), self.canvas.winfo_height()))
-
-        self.update_image()
-        
-    def scroll_y(self, *args, **kwargs):
-        self.canvas.yview(*args, **kwargs) 
-        self.update_image() 
-
-    def scroll_x(self, *args, **kwargs):
-        self.canvas.xview(*args, **kwargs) 
-        self.update_image() 
-
-    def save_state(self):
-        state_name = self.state_name_entry.get().strip()
-        if not state_name:
-            messagebox.showerror("Error", "Please enter a state name.")
-            return
-
-        state_id = self.state_id_entry.get().strip()
-        if not state_id.isdigit() or int(state_id) in self.used_state_ids:
-            messagebox.showerror("Error", "State ID must be a unique number.")
-            return
-
-        arable_land = self.arable_land_entry.get().strip()
-        if not arable_land.isdigit():
-            messagebox.showerror("Error", "Arable land must be a number.")
-            return
-
-        self.all_states.append(self.state_data)
-        self.used_state_ids.add(int(state_id))
-
-        self.state_colors[int(state_id)] = self.current_state_color
-
-        self.hex_codes = []
-        self.highlighted_provinces = set()
-
-        self.provinces_text.delete('1.0', tk.END)
-        self.state_name_entry.delete(0, tk.END)
-        self.state_id_entry.delete(0, tk.END)
-        self.arable_land_entry.delete(0, tk.END)
-        for var in self.subsistence_vars.values():
-            var.set(False)
-        for var in self.arable_resources_vars.values():
-            var.set(False)
-        for var, entry in self.capped_resources_vars.values():
-            var.set(False)
-            entry.delete(0, tk.END)
-        for var, entry in self.special_resources_vars.values():
-            var.set(False)
-            entry.delete(0, tk.END)
-
-        for entry in self.special_assignments.values():
-            if entry is not None:
-                entry.delete(0, tk.END)
-
-        self.current_state_color = self.generate_random_color()
-        self.color_preview.config(bg=self.current_state_color)
-        self.current_assignment = None
-
-        self.update_image()
-
-    def update_provinces_text(self):
-        self.provinces_text.delete('1.0', tk.END)
-        state_name = self.state_name_entry.get().strip().replace(' ', '_').upper()
-    
-        self.state_data = f"STATE_{state_name} = {{\n"
-        self.state_data += f"    id = {self.state_id_entry.get()}\n"
-        
-        checked_subsistence = [label for label, var in self.subsistence_vars.items() if var.get()]
-        self.state_data += f'    subsistence_building = "{checked_subsistence[0] if checked_subsistence else ""}"\n'
-        
-        self.state_data += f"    provinces = {{ {' '.join(f'\"{code}\"' for code in self.hex_codes)} }}\n"
-
-        for assignment, entry in self.special_assignments.items():
-            if entry is not None and entry.get():
-                self.state_data += f"    {assignment} = \"{entry.get()}\"\n"
-
-        arable_land = self.arable_land_entry.get().strip()
-        if arable_land.isdigit():
-            self.state_data += f"    arable_land = {arable_land}\n"
-
-        arable_resources = [f'"{res}"' for res, var in self.arable_resources_vars.items() if var.get()]
-        if arable_resources:
-            self.state_data += f"    arable_resources = {{ {' '.join(arable_resources)} }}\n"
-
-        capped_resources = {res: entry.get() for res, (var, entry) in self.capped_resources_vars.items() if var.get() and entry.get().strip()}
-        if capped_resources:
-            self.state_data += "    capped_resources = {\n"
-            for res, value in capped_resources.items():
-                self.state_data += f"        {res} = {value}\n"
-            self.state_data += "    }\n"
-
-        for res, (var, entry) in self.special_resources_vars.items():
-            if var.get() and entry.get().strip():
-                resource_type = "bg_gold_mining" if res == "bg_gold_fields" else res
-                self.state_data += f"""    resource = {{
-        type = "{res}"
-        {"depleted_type = \"bg_gold_mining\"" if res == "bg_gold_fields" else ""}
-        undiscovered_amount = {entry.get()}
-    }}\n"""
-
-        self.state_data += "}\n"
-        self.provinces_text.insert(tk.END, self.state_data)
-
-    def on_subsistence_change(self):
-        checked = [key for key, var in self.subsistence_vars.items() if var.get()]
-        if len(checked) > 1:
-            for key in checked[1:]:
-                self.subsistence_vars[key].set(False)
-        self.update_provinces_text()
-
-    def on_change(self, event):
-        self.update_provinces_text()
-
-    def create_widgets(self):
-        main_frame = ttk.Frame(self.root)
-        main_frame.pack(fill=tk.BOTH, expand=True)
-
-        self.right_panel = ttk.Frame(main_frame, width=400)
-        self.right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
-
-        self.right_panel.grid_rowconfigure(0, weight=1)
-        self.right_panel.grid_columnconfigure(0, weight=1)
-
-        self.canvas = tk.Canvas(self.right_panel, highlightthickness=0)
-        self.canvas.grid(row=0, column=0, sticky='nswe')
-
-        self.x_scrollbar = ttk.Scrollbar(self.right_panel, orient=tk.HORIZONTAL, command=self.canvas.xview)
-        self.x_scrollbar.grid(row=1, column=0, sticky='ew')
-        self.y_scrollbar = ttk.Scrollbar(self.right_panel, orient=tk.VERTICAL, command=self.canvas.yview)
-        self.y_scrollbar.grid(row=0, column=1, sticky='ns')
-
-        self.canvas.configure(xscrollcommand=self.x_scrollbar.set, yscrollcommand=self.y_scrollbar.set)
-
-        #self.container = self.canvas.create_rectangle(0, 0, 8192, 3616, width=0)
-        self.canvas.update()  
-
-        self.canvas.bind("<Button-1>", self.on_click)
-        self.canvas.bind('<ButtonPress-3>', self.move_from)
-        self.canvas.bind('<B3-Motion>',     self.move_to)
-        self.canvas.bind('<MouseWheel>', self.wheel)
-
-        self.left_panel = ttk.Frame(main_frame, width=400)
-        self.left_panel.pack(side=tk.LEFT, fill=tk.Y)
-        self.left_panel.pack_propagate(False)
-
-        self.notebook = ttk.Notebook(self.left_panel)
-        self.notebook.pack(fill=tk.BOTH, expand=True)
-
-        # Create tabs
-        self.state_tab = ttk.Frame(self.notebook)
-        self.history_tab = ttk.Frame(self.notebook)
-        self.terrain_tab = ttk.Frame(self.notebook)
-        self.settings_tab = ttk.Frame(self.notebook)
-
-        self.notebook.add(self.state_tab, text='State Tab')
-        self.notebook.add(self.history_tab, text='Histroy Tab')
-        self.notebook.add(self.terrain_tab, text='Terreain Tab')
-        self.notebook.add(self.settings_tab, text='Settings')
-
-        # Add content to Tab 1 (3 buttons on top)
-        button_frame = ttk.Frame(self.state_tab)
-
-        button_frame = ttk.Frame(self.state_tab)
-        button_frame.pack(pady=10)
-        self.pick_button = ttk.Button(button_frame, text="Pick PNG", command=self.choose_image)
-        self.save_button = ttk.Button(button_frame, text="Save State", command=self.save_state)
-        self.export_button = ttk.Button(button_frame, text="Export All States", command=self.export_all_states)
-        self.pick_button.pack(side=tk.LEFT, padx=5)
-        self.save_button.pack(side=tk.LEFT, padx=5)
-        self.export_button.pack(side=tk.LEFT, padx=5)
-
-        self.create_state_tab()
-
-
-    def create_state_tab(self):
-        info_frame = ttk.Frame(self.state_tab)
-        info_frame.pack(pady=10, fill=tk.X)
-
-        self.state_id_label = ttk.Label(info_frame, text="State ID:")
-        self.state_id_label.grid(row=0, column=0, padx=(10, 5), sticky="w")
-
-        self.state_id_entry = ttk.Entry(info_frame, width=20)
-        self.state_id_entry.grid(row=0, column=1, padx=(0, 5), pady=10, sticky="ew")
-        self.state_id_entry.bind("<KeyRelease>", self.on_change)
-
-        self.state_id_button = ttk.Button(info_frame, text="Rand", command=self.regen_id)
-        self.state_id_button.grid(row=0, column=2, padx=(0, 10), pady=10, sticky="e")
-
-        self.state_name_label = ttk.Label(info_frame, text="State Name:")
-        self.state_name_label.grid(row=1, column=0, padx=(10, 5), pady= 10, sticky="w")
-        self.state_name_entry = ttk.Entry(info_frame, width=30)
-        self.state_name_entry.grid(row=1, column=1, padx=(0, 10), pady= 10, sticky="e")
-        self.state_name_entry.bind("<KeyRelease>", self.on_change)
-
-        color_frame = ttk.Frame(self.state_tab)
-        color_frame.pack(pady=(10, 0), padx=10, fill=tk.X)
-
-        self.color_preview = tk.Canvas(color_frame, width=47, height=50, bg=self.current_state_color)
-        self.color_preview.grid(row = 1,column= 0, padx=50, sticky="e")
-
-        self.subsistence_vars = {
-            "building_subsistence_farms": tk.BooleanVar(value=False),
-            "building_subsistence_rice_paddies": tk.BooleanVar(value=False),
-            "building_subsistence_pastures": tk.BooleanVar(value=False)
-        }
-
-        for i, (label, var) in enumerate(self.subsistence_vars.items()):
-            cb = ttk.Checkbutton(color_frame, text=label, variable=var, command=self.on_subsistence_change)
-            cb.grid(row=i, column=1, sticky="w")
-
-        arab_frame = ttk.Frame(self.state_tab)
-        arab_frame.pack(padx=30, fill=tk.X)
-
-        self.arable_land_label = ttk.Label(arab_frame, text="Arable Land:")
-        self.arable_land_label.grid(row=0, column=0, padx=(10, 5), sticky="e")
-        self.arable_land_entry = ttk.Entry(arab_frame)
-        self.arable_land_entry.grid(row=0, column=1, padx=(0, 10), sticky="w")
-        self.arable_land_entry.bind("<KeyRelease>", self.on_change)
-
-        self.arable_resources_frame = ttk.Frame(self.state_tab)
-        self.arable_resources_frame.pack(pady=(0, 10), padx=10, fill=tk.X)
-        self.arable_resources_vars = {}
-        arable_resources = [
-            "bg_silk_plantations", "bg_opium_plantations", "bg_cotton_plantations",
-            "bg_coffee_plantations", "bg_dye_plantations", "bg_sugar_plantations",
-            "bg_banana_plantations", "bg_tobacco_plantations", "bg_vineyard_plantations",
-            "bg_maize_farms", "bg_rye_farms", "bg_livestock_ranches", "bg_wheat_farms"
-        ]
-        for i, resource in enumerate(arable_resources):
-            var = tk.BooleanVar()
-            cb = ttk.Checkbutton(self.arable_resources_frame, text=resource, variable=var, command=self.update_provinces_text)
-            cb.grid(row=i // 2, column=i % 2, sticky="w")
-            self.arable_resources_vars[resource] = var
-
-        self.resources_frame = ttk.Frame(self.state_tab)
-        self.resources_frame.pack(pady=(0, 10), padx=10, fill=tk.X)
-
-        self.capped_resources_vars = {}
-        capped_resources = [
-            "bg_coal_mining", "bg_iron_mining", "bg_lead_mining", "bg_sulfur_mining",
-            "bg_logging", "bg_fishing", "bg_monuments"
-        ]
-        for i, resource in enumerate(capped_resources):
-            var = tk.BooleanVar()
-            cb = ttk.Checkbutton(self.resources_frame, text=resource, variable=var, command=self.update_provinces_text)
-            cb.grid(row=i, column=0, sticky="w")
-            entry = ttk.Entry(self.resources_frame, width=5)
-            entry.grid(row=i, column=1, padx=(0, 10))
-            entry.bind("<KeyRelease>", self.on_change)
-            self.capped_resources_vars[resource] = (var, entry)
-
-        self.special_resources_vars = {}
-        special_resources = [
-            "bg_oil_extraction",
-            "bg_gold_fields",
-            "bg_rubber"
-        ]
-        for i, resource in enumerate(special_resources):
-            var = tk.BooleanVar()
-            cb = ttk.Checkbutton(self.resources_frame, text=resource, variable=var, command=self.update_provinces_text)
-            cb.grid(row=i, column=2, sticky="w")
-            entry = ttk.Entry(self.resources_frame, width=5)
-            entry.grid(row=i, column=3, padx=(0, 10))
-            entry.bind("<KeyRelease>", self.on_change)
-            self.special_resources_vars[resource] = (var, entry)
-
-        self.special_assignments_frame = ttk.Frame(self.state_tab)
-        self.special_assignments_frame.pack(pady=(0, 10), padx=5, fill=tk.X)
-
-        for i, assignment in enumerate(["city", "farm", "mine", "wood", "port"]):
-            btn = ttk.Button(self.special_assignments_frame, text=assignment.capitalize(), command=lambda a=assignment: self.set_current_assignment(a), width=8)
-            btn.grid(row=0, column=i, padx=5)
-            entry = ttk.Entry(self.special_assignments_frame, width=8)
-            entry.grid(row=1, column=i, padx=5, pady=(5, 0))
-            self.special_assignments[assignment] = entry
-
-
-        self.provinces_label = ttk.Label(self.state_tab, text="Current State Configuration:")
-        self.provinces_label.pack(pady=(10, 0))
-
-        self.provinces_text = tk.Text(self.state_tab, height=10, wrap=tk.WORD)
-        self.provinces_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
-
-
-    def export_all_states(self):
-        file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
-        if file_path:
-            with open(file_path, 'w') as f:
-                for state_data in self.all_states:
-                    f.write(state_data + '\n')
-
-    def generate_random_color(self):
-        while True:
-            color = "#{:06x}".format(random.randint(0, 0xFFFFFF))
-            if color not in self.state_colors.values():
-                return color
-
-    @staticmethod
-    def hex_to_rgb(hex_color):
-        return tuple(int(hex_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-    
-    @staticmethod
-    def rgb_to_hex(rgb):
-        r, g, b = rgb   
-        hex_color = '#{:02x}{:02x}{:02x}'.format(r, g, b)
-        
-        return hex_color
-    
-    def regen_id(self):       
-        new_id = 1
-        while new_id in self.used_state_ids:
-            new_id += 1
-        
-        self.state_id_entry.delete(0, tk.END)
-        self.state_id_entry.insert(0, str(new_id))
-
-    def set_current_assignment(self, assignment):
-        self.current_assignment = assignment
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    app = VicStatePainter(root)
+import os
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from borders import BorderMask, PROVINCE_EDGE, STATE_EDGE
+from painter_core import PainterCore
+from project import read_project_meta
+from profiler import Profiler
+from renderer import TileRenderer
+from scheduler import FrameScheduler
+from states import HUB_TYPES, format_state
+from terrain import TERRAIN_TYPES, load_mask, read_province_terrains, write_province_terrains
+
+class VicStatePainter:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("State Painter")
+        self.root.geometry("1800x1000")
+
+        self.x = 0
+        self.y = 0   
+        self.state_id = 1
+        self.max_zoom = 1
+
+        self.scale = 1
+        self.p_scale = 1
+        self.delta = 1.3
+
+        self.width = 8192
+        self.height = 3616 
+
+        self.vec = [0,0]
+
+        self.profiler = Profiler()
+        self.core = PainterCore(profiler=self.profiler)
+
+        self.special_assignments = {}
+        self.current_assignment = None
+        self.overlay_after = None
+        self.selection = None
+        self.borders = None
+        self.workers = ThreadPoolExecutor(max_workers=1)
+        self.terrain_job = None
+        self.validation_job = None
+        self.validation_after = None
+        
+        self.create_widgets()
+
+    def choose_image(self):
+        file_path = filedialog.askopenfilename(filetypes=[("PNG files", "*.png")])
+        if not file_path:
+            return
+        self.borders = None
+        self.core.load_map(file_path)
+        self.map_loaded()
+
+    def map_loaded(self):
+        self.width, self.height = self.province_index.width, self.province_index.height
+        self.current_assignment = None
+        self.fill_form(self.current_state)
+        self.provinces_text.delete('1.0', tk.END)
+        if self.current_state.provinces:
+            self.update_provinces_text()
+        self.project_label.config(text=self.core.project_path or "No project; changes are not saved")
+        self.sea_label.config(text="No sea provinces loaded")
+        self.renderer.set_source(self.province_index.labels, self.core.display_colors)
+        self.set_border_mode()
+        self.refresh_terrain_classes()
+        self.checks_list.delete(*self.checks_list.get_children())
+        self.checks_status.config(text="Saved states have not been checked yet.")
+        self.update_image()
+
+    @property
+    def province_index(self):
+        return self.core.province_index
+
+    @property
+    def registry(self):
+        return self.core.registry
+
+    @property
+    def current_state(self):
+        return self.core.current_state
+
+    def update_image(self, event = None):
+        self.frames.request()
+
+    def render_frame(self):
+        if self.province_index is None:
+            return
+
+        cx, cy = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        cw, ch = self.canvas.winfo_width(), self.canvas.winfo_height()
+        endx, endy = int(cw / self.scale), int(ch / self.scale)
+
+        self.vec[0] =  max(0, self.vec[0])
+        self.vec[1] =  max(0, self.vec[1])
+
+        ddx = (endx + self.vec[0]) - self.width
+        ddy = (endy + self.vec[1])  - self.height
+
+        if(ddx > 0):
+            self.vec[0] = self.vec[0] - ddx
+        if(ddy > 0):
+            self.vec[1] = self.vec[1] - ddy
+
+        self.renderer.draw(self.scale, self.vec, (cx, cy, cw, ch))
+
+        self.canvas.configure(scrollregion=(-cw, -ch, (self.width * self.scale), (self.height * self.scale)))
+        self.draw_overlay()
+        
+
+    def on_click(self, event, reassign=False):
+        if self.province_index is None:
+            return
+
+        self.x = self.canvas.canvasx(event.x)
+        self.y = self.canvas.canvasy(event.y)
+        label = self.core.label_at(*self.image_point(self.x, self.y))
+        if label is not None and self.notebook.select() == str(self.terrain_tab):
+            self.show_province_terrain(label)
+            return
+        if label is not None and self.core.toggle_province(label, reassign, self.current_assignment):
+            self.current_assignment = None
+            self.refresh_hub_entries()
+            self.update_provinces_text()
+            self.update_image()
+
+    def image_point(self, canvas_x, canvas_y):
+        return int(canvas_x / self.scale) + self.vec[0], int(canvas_y / self.scale) + self.vec[1]
+
+    def start_selection(self, event, lasso=False, remove=False):
+        if self.province_index is None:
+            return
+        point = (self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        self.selection = {"lasso": lasso, "remove": remove, "points": [point]}
+        color = "red" if remove else "white"
+        if lasso:
+            self.canvas.create_line(*point, *point, fill=color, tags="selection")
+        else:
+            self.canvas.create_rectangle(*point, *point, outline=color, dash=(4, 2), tags="selection")
+
+    def extend_selection(self, event):
+        if self.selection is None:
+            return
+        point = (self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+        points = self.selection["points"]
+        if self.selection["lasso"]:
+            points.append(point)
+            self.canvas.coords("selection", *[c for p in points for c in p])
+        else:
+            points[1:] = [point]
+            self.canvas.coords("selection", *points[0], *point)
+
+    def finish_selection(self, event):
+        if self.selection is None:
+            return
+        self.extend_selection(event)
+        selection, self.selection = self.selection, None
+        self.canvas.delete("selection")
+
+        points = [self.image_point(x, y) for x, y in selection["points"]]
+        if selection["lasso"]:
+            if len(points) < 3:
+                return
+            labels = self.province_index.labels_in_polygon(points)
+        else:
+            labels = self.province_index.labels_in_rect(*points[0], *points[-1])
+        if len(self.core.select_provinces(labels, remove=selection["remove"])):
+            self.refresh_hub_entries()
+            self.update_provinces_text()
+            self.update_image()
+
+    def move_from(self, event):
+        self.x = self.canvas.canvasx(event.x)
+        self.y = self.canvas.canvasy(event.y)
+        self.canvas.scan_mark(event.x, event.y)
+
+    def move_to(self, event):
+        self.x = self.canvas.canvasx(event.x)
+        self.y = self.canvas.canvasy(event.y)
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        
+        self.update_image()
+
+    def wheel(self, event):
+        self.max_zoom = max(self.canvas.winfo_width() / self.width, self.canvas.winfo_height() / self.height)
+
+        self.x, self.y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        zoom_in = event.delta if event.delta else 0
+
+        if zoom_in != 0:
+            self.p_scale = self.scale
+            self.scale *= self.delta if zoom_in > 0 else 1/self.delta
+            self.scale = max(self.scale, self.max_zoom)
+            self.scale = min(self.scale, max(self.canvas.winfo_width(), self.canvas.winfo_height()))
+
+            # keep the pixel under the cursor in place; done here rather than at render
+            # time so several wheel steps coalesced into one frame all apply
+            currX = int(self.x / self.p_scale) + self.vec[0]
+            currY = int(self.y / self.p_scale) + self.vec[1]
+            self.vec[0] = int(currX - (self.x / self.scale))
+            self.vec[1] = int(currY - (self.y / self.scale))
+
+        self.update_image()
+        
+    def scroll_y(self, *args, **kwargs):
+        self.canvas.yview(*args, **kwargs) 
+        self.update_image() 
+
+    def scroll_x(self, *args, **kwargs):
+        self.canvas.xview(*args, **kwargs) 
+        self.update_image() 
+
+    def save_state(self):
+        state_name = self.state_name_entry.get().strip()
+        if not state_name:
+            messagebox.showerror("Error", "Please enter a state name.")
+            return
+
+        state_id = self.state_id_entry.get().strip()
+        existing = self.registry.by_id.get(int(state_id)) if state_id.isdigit() else None
+        if not state_id.isdigit() or (existing is not None and existing is not self.current_state):
+            messagebox.showerror("Error", "State ID must be a unique number.")
+            return
+
+        arable_land = self.arable_land_entry.get().strip()
+        if not arable_land.isdigit():
+            messagebox.showerror("Error", "Arable land must be a number.")
+            return
+
+        self.core.journal.begin()
+        self.read_form()
+        self.core.save_current_state(int(state_id))
+        self.core.journal.commit()
+        self.new_state_form()
+
+    def new_state_form(self):
+        self.current_assignment = None
+        self.fill_form(self.current_state)
+        self.provinces_text.delete('1.0', tk.END)
+        self.update_image()
+        self.schedule_validation()
+
+    def edit_state(self):
+        state_id = self.state_id_entry.get().strip()
+        state = self.registry.by_id.get(int(state_id)) if state_id.isdigit() else None
+        if state is None:
+            messagebox.showerror("Error", "No saved state with that ID.")
+            return
+        if state is self.current_state:
+            return
+
+        self.core.edit_state(state)
+        self.current_assignment = None
+        self.fill_form(state)
+        self.update_provinces_text()
+        self.update_image()
+
+    def read_form(self):
+        state = self.current_state
+        self.registry.set_field(state, "name", self.state_name_entry.get().strip())
+
+        checked_subsistence = [label for label, var in self.subsistence_vars.items() if var.get()]
+        if checked_subsistence or state.subsistence_building in self.subsistence_vars:
+            self.registry.set_field(state, "subsistence_building", checked_subsistence[0] if checked_subsistence else "")
+
+        for assignment, entry in self.special_assignments.items():
+            label = self.province_index.label_of(entry.get().strip()) if self.province_index else None
+            self.registry.set_hub(state, assignment, label)
+
+        arable_land = self.arable_land_entry.get().strip()
+        self.registry.set_field(state, "arable_land", int(arable_land) if arable_land.isdigit() else None)
+        # resources without a widget (e.g. from imported files) are kept as they are
+        arable_resources = [res for res in state.arable_resources if res not in self.arable_resources_vars]
+        arable_resources += [res for res, var in self.arable_resources_vars.items() if var.get()]
+        self.registry.set_field(state, "arable_resources", arable_resources)
+        for name, widgets in (("capped_resources", self.capped_resources_vars),
+                              ("special_resources", self.special_resources_vars)):
+            values = {res: value for res, value in getattr(state, name).items() if res not in widgets}
+            for res, (var, entry) in widgets.items():
+                if var.get() and entry.get().strip():
+                    values[res] = entry.get().strip()
+            self.registry.set_field(state, name, values)
+
+    def fill_form(self, state):
+        self.state_id_entry.delete(0, tk.END)
+        if state.state_id is not None:
+            self.state_id_entry.insert(0, str(state.state_id))
+        self.state_name_entry.delete(0, tk.END)
+        self.state_name_entry.insert(0, state.name)
+        self.arable_land_entry.delete(0, tk.END)
+        if state.arable_land is not None:
+            self.arable_land_entry.insert(0, str(state.arable_land))
+
+        for label, var in self.subsistence_vars.items():
+            var.set(label == state.subsistence_building)
+        for res, var in self.arable_resources_vars.items():
+            var.set(res in state.arable_resources)
+        for values, widgets in ((state.capped_resources, self.capped_resources_vars),
+                                (state.special_resources, self.special_resources_vars)):
+            for res, (var, entry) in widgets.items():
+                var.set(res in values)
+                entry.delete(0, tk.END)
+                entry.insert(0, values.get(res, ""))
+
+        self.refresh_hub_entries()
+        self.color_preview.config(bg=state.color)
+
+    def refresh_hub_entries(self):
+        for assignment, entry in self.special_assignments.items():
+            entry.delete(0, tk.END)
+            label = self.current_state.hubs.get(assignment)
+            if label is not None:
+                entry.insert(0, self.province_index.hex_code(label))
+
+    def update_provinces_text(self):
+        self.provinces_text.delete('1.0', tk.END)
+        self.read_form()
+        if self.province_index is not None:
+            with self.profiler.stage("state_text"):
+                text = format_state(self.current_state, self.province_index, self.state_id_entry.get().strip())
+            self.provinces_text.insert(tk.END, text)
+            self.update_state_info()
+            self.schedule_validation()
+
+    def on_subsistence_change(self):
+        checked = [key for key, var in self.subsistence_vars.items() if var.get()]
+        if len(checked) > 1:
+            for key in checked[1:]:
+                self.subsistence_vars[key].set(False)
+        self.update_provinces_text()
+
+    def on_change(self, event):
+        self.update_provinces_text()
+
+    def create_widgets(self):
+        main_frame = ttk.Frame(self.root)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.right_panel = ttk.Frame(main_frame, width=400)
+        self.right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+
+        self.right_panel.grid_rowconfigure(0, weight=1)
+        self.right_panel.grid_columnconfigure(0, weight=1)
+
+        self.canvas = tk.Canvas(self.right_panel, highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky='nswe')
+        self.renderer = TileRenderer(self.canvas, profiler=self.profiler)
+        self.core.on_repaint = self.repaint
+        self.frames = FrameScheduler(self.root, self.render_frame, profiler=self.profiler)
+
+        self.x_scrollbar = ttk.Scrollbar(self.right_panel, orient=tk.HORIZONTAL, command=self.scroll_x)
+        self.x_scrollbar.grid(row=1, column=0, sticky='ew')
+        self.y_scrollbar = ttk.Scrollbar(self.right_panel, orient=tk.VERTICAL, command=self.scroll_y)
+        self.y_scrollbar.grid(row=0, column=1, sticky='ns')
+
+        self.canvas.configure(xscrollcommand=self.x_scrollbar.set, yscrollcommand=self.y_scrollbar.set)
+
+        #self.container = self.canvas.create_rectangle(0, 0, 8192, 3616, width=0)
+        self.canvas.update()  
+
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<Shift-Button-1>", lambda event: self.on_click(event, reassign=True))
+        self.canvas.bind("<Control-Button-1>", self.start_selection)
+        self.canvas.bind("<Control-Shift-Button-1>", lambda event: self.start_selection(event, remove=True))
+        self.canvas.bind("<Alt-Button-1>", lambda event: self.start_selection(event, lasso=True))
+        self.canvas.bind("<Alt-Shift-Button-1>", lambda event: self.start_selection(event, lasso=True, remove=True))
+        self.canvas.bind("<B1-Motion>", self.extend_selection)
+        self.canvas.bind("<ButtonRelease-1>", self.finish_selection)
+        self.canvas.bind('<ButtonPress-3>', self.move_from)
+        self.canvas.bind('<B3-Motion>',     self.move_to)
+        self.canvas.bind('<MouseWheel>', self.wheel)
+        self.root.bind('<Control-z>', self.undo)
+        self.root.bind('<Control-y>', self.redo)
+        self.root.bind('<Control-Z>', self.redo)
+
+        self.left_panel = ttk.Frame(main_frame, width=400)
+        self.left_panel.pack(side=tk.LEFT, fill=tk.Y)
+        self.left_panel.pack_propagate(False)
+
+        self.notebook = ttk.Notebook(self.left_panel)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+
+        # Create tabs
+        self.state_tab = ttk.Frame(self.notebook)
+        self.history_tab = ttk.Frame(self.notebook)
+        self.terrain_tab = ttk.Frame(self.notebook)
+        self.checks_tab = ttk.Frame(self.notebook)
+        self.settings_tab = ttk.Frame(self.notebook)
+
+        self.notebook.add(self.state_tab, text='State Tab')
+        self.notebook.add(self.history_tab, text='Histroy Tab')
+        self.notebook.add(self.terrain_tab, text='Terreain Tab')
+        self.notebook.add(self.checks_tab, text='Checks')
+        self.notebook.add(self.settings_tab, text='Settings')
+
+        # Add content to Tab 1 (3 buttons on top)
+        button_frame = ttk.Frame(self.state_tab)
+
+        button_frame = ttk.Frame(self.state_tab)
+        button_frame.pack(pady=10)
+        self.pick_button = ttk.Button(button_frame, text="Pick PNG", command=self.choose_image)
+        self.save_button = ttk.Button(button_frame, text="Save State", command=self.save_state)
+        self.edit_button = ttk.Button(button_frame, text="Edit State", command=self.edit_state)
+        self.import_button = ttk.Button(button_frame, text="Import States", command=self.import_states)
+        self.export_button = ttk.Button(button_frame, text="Export All States", command=self.export_all_states)
+        self.pick_button.pack(side=tk.LEFT, padx=5)
+        self.save_button.pack(side=tk.LEFT, padx=5)
+        self.edit_button.pack(side=tk.LEFT, padx=5)
+        self.import_button.pack(side=tk.LEFT, padx=5)
+        self.export_button.pack(side=tk.LEFT, padx=5)
+
+        self.create_state_tab()
+        self.create_terrain_tab()
+        self.create_checks_tab()
+        self.create_settings_tab()
+
+    def create_state_tab(self):
+        info_frame = ttk.Frame(self.state_tab)
+        info_frame.pack(pady=10, fill=tk.X)
+
+        self.state_id_label = ttk.Label(info_frame, text="State ID:")
+        self.state_id_label.grid(row=0, column=0, padx=(10, 5), sticky="w")
+
+        self.state_id_entry = ttk.Entry(info_frame, width=20)
+        self.state_id_entry.grid(row=0, column=1, padx=(0, 5), pady=10, sticky="ew")
+        self.state_id_entry.bind("<KeyRelease>", self.on_change)
+
+        self.state_id_button = ttk.Button(info_frame, text="Rand", command=self.regen_id)
+        self.state_id_button.grid(row=0, column=2, padx=(0, 10), pady=10, sticky="e")
+
+        self.state_name_label = ttk.Label(info_frame, text="State Name:")
+        self.state_name_label.grid(row=1, column=0, padx=(10, 5), pady= 10, sticky="w")
+        self.state_name_entry = ttk.Entry(info_frame, width=30)
+        self.state_name_entry.grid(row=1, column=1, padx=(0, 10), pady= 10, sticky="e")
+        self.state_name_entry.bind("<KeyRelease>", self.on_change)
+
+        color_frame = ttk.Frame(self.state_tab)
+        color_frame.pack(pady=(10, 0), padx=10, fill=tk.X)
+
+        self.color_preview = tk.Canvas(color_frame, width=47, height=50, bg=self.current_state.color)
+        self.color_preview.grid(row = 1,column= 0, padx=50, sticky="e")
+        self.color_preview.bind("<Button-1>", self.change_color)
+
+        self.subsistence_vars = {
+            "building_subsistence_farms": tk.BooleanVar(value=False),
+            "building_subsistence_rice_paddies": tk.BooleanVar(value=False),
+            "building_subsistence_pastures": tk.BooleanVar(value=False)
+        }
+
+        for i, (label, var) in enumerate(self.subsistence_vars.items()):
+            cb = ttk.Checkbutton(color_frame, text=label, variable=var, command=self.on_subsistence_change)
+            cb.grid(row=i, column=1, sticky="w")
+
+        arab_frame = ttk.Frame(self.state_tab)
+        arab_frame.pack(padx=30, fill=tk.X)
+
+        self.arable_land_label = ttk.Label(arab_frame, text="Arable Land:")
+        self.arable_land_label.grid(row=0, column=0, padx=(10, 5), sticky="e")
+        self.arable_land_entry = ttk.Entry(arab_frame)
+        self.arable_land_entry.grid(row=0, column=1, padx=(0, 10), sticky="w")
+        self.arable_land_entry.bind("<KeyRelease>", self.on_change)
+        self.suggest_button = ttk.Button(arab_frame, text="Suggest", command=self.suggest_defaults)
+        self.suggest_button.grid(row=0, column=2, sticky="w")
+
+        self.arable_resources_frame = ttk.Frame(self.state_tab)
+        self.arable_resources_frame.pack(pady=(0, 10), padx=10, fill=tk.X)
+        self.arable_resources_vars = {}
+        arable_resources = [
+            "bg_silk_plantations", "bg_opium_plantations", "bg_cotton_plantations",
+            "bg_coffee_plantations", "bg_dye_plantations", "bg_sugar_plantations",
+            "bg_banana_plantations", "bg_tobacco_plantations", "bg_vineyard_plantations",
+            "bg_maize_farms", "bg_rye_farms", "bg_livestock_ranches", "bg_wheat_farms"
+        ]
+        for i, resource in enumerate(arable_resources):
+            var = tk.BooleanVar()
+            cb = ttk.Checkbutton(self.arable_resources_frame, text=resource, variable=var, command=self.update_provinces_text)
+            cb.grid(row=i // 2, column=i % 2, sticky="w")
+            self.arable_resources_vars[resource] = var
+
+        self.resources_frame = ttk.Frame(self.state_tab)
+        self.resources_frame.pack(pady=(0, 10), padx=10, fill=tk.X)
+
+        self.capped_resources_vars = {}
+        capped_resources = [
+            "bg_coal_mining", "bg_iron_mining", "bg_lead_mining", "bg_sulfur_mining",
+            "bg_logging", "bg_fishing", "bg_monuments"
+        ]
+        for i, resource in enumerate(capped_resources):
+            var = tk.BooleanVar()
+            cb = ttk.Checkbutton(self.resources_frame, text=resource, variable=var, command=self.update_provinces_text)
+            cb.grid(row=i, column=0, sticky="w")
+            entry = ttk.Entry(self.resources_frame, width=5)
+            entry.grid(row=i, column=1, padx=(0, 10))
+            entry.bind("<KeyRelease>", self.on_change)
+            self.capped_resources_vars[resource] = (var, entry)
+
+        self.special_resources_vars = {}
+        special_resources = [
+            "bg_oil_extraction",
+            "bg_gold_fields",
+            "bg_rubber"
+        ]
+        for i, resource in enumerate(special_resources):
+            var = tk.BooleanVar()
+            cb = ttk.Checkbutton(self.resources_frame, text=resource, variable=var, command=self.update_provinces_text)
+            cb.grid(row=i, column=2, sticky="w")
+            entry = ttk.Entry(self.resources_frame, width=5)
+            entry.grid(row=i, column=3, padx=(0, 10))
+            entry.bind("<KeyRelease>", self.on_change)
+            self.special_resources_vars[resource] = (var, entry)
+
+        self.special_assignments_frame = ttk.Frame(self.state_tab)
+        self.special_assignments_frame.pack(pady=(0, 10), padx=5, fill=tk.X)
+
+        for i, assignment in enumerate(HUB_TYPES):
+            btn = ttk.Button(self.special_assignments_frame, text=assignment.capitalize(), command=lambda a=assignment: self.set_current_assignment(a), width=8)
+            btn.grid(row=0, column=i, padx=5)
+            entry = ttk.Entry(self.special_assignments_frame, width=8)
+            entry.grid(row=1, column=i, padx=5, pady=(5, 0))
+            entry.bind("<KeyRelease>", self.on_change)
+            self.special_assignments[assignment] = entry
+
+
+        self.state_info_label = ttk.Label(self.state_tab, text="")
+        self.state_info_label.pack(pady=(5, 0))
+
+        self.provinces_label = ttk.Label(self.state_tab, text="Current State Configuration:")
+        self.provinces_label.pack(pady=(10, 0))
+
+        self.provinces_text = tk.Text(self.state_tab, height=10, wrap=tk.WORD)
+        self.provinces_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+    def create_terrain_tab(self):
+        button_frame = ttk.Frame(self.terrain_tab)
+        button_frame.pack(pady=10)
+        self.terrain_mask_button = ttk.Button(button_frame, text="Load Terrain Mask", command=self.load_terrain_mask)
+        self.terrain_mask_button.pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Import Terrains", command=self.import_terrains).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export Terrains", command=self.export_terrains).pack(side=tk.LEFT, padx=5)
+
+        self.terrain_status = ttk.Label(self.terrain_tab, text="Each colour of the mask is a terrain class; "
+                                                               "pick a terrain for every class.", wraplength=380)
+        self.terrain_status.pack(padx=10, fill=tk.X)
+
+        self.terrain_classes = ttk.Treeview(self.terrain_tab, columns=("color", "provinces", "mixed", "terrain"),
+                                            show="headings", height=12)
+        for column, width in (("color", 90), ("provinces", 80), ("mixed", 60), ("terrain", 150)):
+            self.terrain_classes.heading(column, text=column.capitalize())
+            self.terrain_classes.column(column, width=width)
+        self.terrain_classes.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+        class_frame = ttk.Frame(self.terrain_tab)
+        class_frame.pack(padx=10, fill=tk.X)
+        self.class_terrain_var = tk.StringVar(value=TERRAIN_TYPES[0])
+        ttk.Combobox(class_frame, textvariable=self.class_terrain_var, values=TERRAIN_TYPES, width=15).grid(row=0, column=0, padx=(0, 5))
+        ttk.Button(class_frame, text="Set Selected Classes", command=self.set_class_terrain).grid(row=0, column=1)
+
+        province_frame = ttk.Frame(self.terrain_tab)
+        province_frame.pack(padx=10, pady=10, fill=tk.X)
+        ttk.Label(province_frame, text="Province:").grid(row=0, column=0, padx=(0, 5), sticky="w")
+        self.terrain_province_entry = ttk.Entry(province_frame, width=10)
+        self.terrain_province_entry.grid(row=0, column=1, padx=(0, 5))
+        self.province_terrain_var = tk.StringVar()
+        ttk.Combobox(province_frame, textvariable=self.province_terrain_var, values=TERRAIN_TYPES, width=15).grid(row=0, column=2, padx=(0, 5))
+        ttk.Button(province_frame, text="Set", command=self.set_province_terrain).grid(row=0, column=3)
+
+    def load_terrain_mask(self):
+        if self.province_index is None:
+            messagebox.showerror("Error", "Pick a provinces PNG first.")
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("PNG files", "*.png"), ("All files", "*.*")])
+        if not file_path or self.terrain_job is not None:
+            return
+        self.terrain_mask_button.state(["disabled"])
+        self.terrain_status.config(text="Classifying provinces...")
+        # classified on a worker thread; the result is applied on the Tk thread
+        self.terrain_job = (self.province_index, perf_counter(), self.workers.submit(load_mask, file_path, self.province_index))
+        self.root.after(50, self.poll_terrain_job)
+
+    def poll_terrain_job(self):
+        index, started, future = self.terrain_job
+        if not future.done():
+            self.root.after(50, self.poll_terrain_job)
+            return
+        self.terrain_job = None
+        self.terrain_mask_button.state(["!disabled"])
+        if index is not self.province_index:
+            return
+        if future.exception() is not None:
+            self.terrain_status.config(text="")
+            messagebox.showerror("Error", str(future.exception()))
+            return
+        self.core.terrain.set_classes(*future.result())
+        self.terrain_status.config(text=f"{len(self.core.terrain.class_colors)} terrain classes, "
+                                        f"classified in {perf_counter() - started:.2f} s")
+        self.refresh_terrain_classes()
+
+    def refresh_terrain_classes(self):
+        terrain = self.core.terrain
+        self.terrain_classes.delete(*self.terrain_classes.get_children())
+        rows = zip(terrain.class_colors.tolist(), terrain.class_provinces().tolist(), terrain.class_mixed().tolist())
+        for cls, (color, provinces, mixed) in enumerate(rows):
+            color = "#{:06x}".format(color)
+            self.terrain_classes.tag_configure(f"class{cls}", background=color)
+            self.terrain_classes.insert("", tk.END, iid=str(cls), tags=(f"class{cls}",),
+                                        values=(color, provinces, mixed, terrain.class_terrain[cls] or ""))
+
+    def set_class_terrain(self):
+        if self.province_index is None:
+            return
+        for cls in self.terrain_classes.selection():
+            self.core.terrain.set_class_terrain(int(cls), self.class_terrain_var.get().strip() or None)
+        self.refresh_terrain_classes()
+
+    def show_province_terrain(self, label):
+        self.terrain_province_entry.delete(0, tk.END)
+        self.terrain_province_entry.insert(0, self.province_index.hex_code(label))
+        self.province_terrain_var.set(self.core.terrain.terrain_of(label) or "")
+        terrain = self.core.terrain
+        cls = terrain.majority[label]
+        if cls >= 0:
+            self.terrain_status.config(text=f"{self.province_index.hex_code(label)}: {terrain.share[label]:.0%} "
+                                            f"of its pixels are class #{terrain.class_colors[cls]:06x}")
+
+    def set_province_terrain(self):
+        label = self.province_index.label_of(self.terrain_province_entry.get().strip()) if self.province_index else None
+        if label is None:
+            messagebox.showerror("Error", "No province with that code on this map.")
+            return
+        self.core.terrain.set(label, self.province_terrain_var.get().strip() or None)
+
+    def import_terrains(self):
+        if self.province_index is None:
+            messagebox.showerror("Error", "Pick a provinces PNG first.")
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt")])
+        if not file_path:
+            return
+        try:
+            missing = read_province_terrains(file_path, self.province_index, self.core.terrain)
+        except (OSError, ValueError) as error:
+            messagebox.showerror("Error", f"Could not import the terrains: {error}")
+            return
+        if missing:
+            messagebox.showwarning("Import", f"{len(missing)} province codes were not found on this map.")
+
+    def export_terrains(self):
+        if self.province_index is None:
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".txt", initialfile="province_terrains.txt",
+                                                 filetypes=[("Text files", "*.txt")])
+        if file_path:
+            count = write_province_terrains(file_path, self.province_index, self.core.terrain)
+            self.terrain_status.config(text=f"Exported the terrain of {count} provinces")
+
+    def create_checks_tab(self):
+        button_frame = ttk.Frame(self.checks_tab)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="Validate", command=lambda: self.start_validation(force=True)).pack(side=tk.LEFT, padx=5)
+        self.auto_validate_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(button_frame, text="Check after every edit", variable=self.auto_validate_var).pack(side=tk.LEFT, padx=5)
+
+        self.checks_status = ttk.Label(self.checks_tab, text="Saved states have not been checked yet.")
+        self.checks_status.pack(padx=10, fill=tk.X)
+        self.checks_list = ttk.Treeview(self.checks_tab, columns=("check", "states", "provinces"), show="headings")
+        for column, width in (("check", 130), ("states", 130), ("provinces", 120)):
+            self.checks_list.heading(column, text=column.capitalize())
+            self.checks_list.column(column, width=width)
+        self.checks_list.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+
+    def schedule_validation(self, force=False):
+        if not self.auto_validate_var.get():
+            return
+        if self.validation_after is not None:
+            self.root.after_cancel(self.validation_after)
+        self.validation_after = self.root.after(1000, lambda: self.start_validation(force))
+
+    def start_validation(self, force=False):
+        self.validation_after = None
+        if self.province_index is None:
+            return
+        if self.validation_job is not None:
+            # one run at a time; whatever changed meanwhile is picked up next
+            self.schedule_validation()
+            return
+        if not force and self.core.validator is not None and not self.core.registry.touched:
+            return
+        self.checks_status.config(text="Checking...")
+        self.validation_job = (self.province_index, self.core.validate())
+        self.root.after(50, self.poll_validation)
+
+    def poll_validation(self):
+        index, future = self.validation_job
+        if not future.done():
+            self.root.after(50, self.poll_validation)
+            return
+        self.validation_job = None
+        if index is not self.province_index:
+            return
+        self.core.validator.merge(future, self.registry)
+        if future.exception() is not None:
+            self.checks_status.config(text=f"Check failed: {future.exception()}")
+            return
+        self.show_issues(self.core.validator.issues())
+
+    def show_issues(self, issues):
+        self.checks_list.delete(*self.checks_list.get_children())
+        for issue in issues:
+            provinces = issue["provinces"]
+            codes = " ".join(self.province_index.hex_code(label) for label in provinces[:20])
+            if len(provinces) > 20:
+                codes += f" ... ({len(provinces)})"
+            if "parts" in issue:
+                codes = f"{issue['parts']} parts"
+            self.checks_list.insert("", tk.END, values=(issue["check"], " ".join(issue["states"]), codes))
+        self.checks_status.config(text=f"{len(issues)} issues in {len(self.registry.states())} saved states"
+                                  if issues else f"No issues in {len(self.registry.states())} saved states")
+
+    def create_settings_tab(self):
+        map_frame = ttk.Frame(self.settings_tab)
+        map_frame.pack(pady=10, padx=10, fill=tk.X)
+
+        self.sea_button = ttk.Button(map_frame, text="Load default.map", command=self.load_sea_provinces)
+        self.sea_button.grid(row=0, column=0, padx=(0, 10), sticky="w")
+        self.sea_label = ttk.Label(map_frame, text="No sea provinces loaded")
+        self.sea_label.grid(row=0, column=1, sticky="w")
+
+        project_frame = ttk.LabelFrame(self.settings_tab, text="Project")
+        project_frame.pack(pady=10, padx=10, fill=tk.X)
+        ttk.Button(project_frame, text="Save Project", command=self.save_project).grid(row=0, column=0, padx=(0, 5), pady=5, sticky="w")
+        ttk.Button(project_frame, text="Open Project", command=self.open_project).grid(row=0, column=1, pady=5, sticky="w")
+        self.project_label = ttk.Label(project_frame, text="No project; changes are not saved", wraplength=360)
+        self.project_label.grid(row=1, column=0, columnspan=2, sticky="w")
+
+        display_frame = ttk.LabelFrame(self.settings_tab, text="Borders")
+        display_frame.pack(pady=10, padx=10, fill=tk.X)
+        self.border_var = tk.IntVar(value=0)
+        for column, (text, mode) in enumerate((("None", 0), ("States", STATE_EDGE),
+                                               ("States and provinces", STATE_EDGE | PROVINCE_EDGE))):
+            ttk.Radiobutton(display_frame, text=text, variable=self.border_var, value=mode,
+                            command=self.set_border_mode).grid(row=0, column=column, padx=(0, 10), sticky="w")
+
+        profile_frame = ttk.LabelFrame(self.settings_tab, text="Profiling")
+        profile_frame.pack(pady=10, padx=10, fill=tk.X)
+
+        self.profiling_var = tk.BooleanVar(value=False)
+        self.overlay_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(profile_frame, text="Record timings", variable=self.profiling_var,
+                        command=self.toggle_profiling).grid(row=0, column=0, sticky="w")
+        ttk.Checkbutton(profile_frame, text="Show overlay", variable=self.overlay_var,
+                        command=self.draw_overlay).grid(row=0, column=1, sticky="w")
+        ttk.Button(profile_frame, text="Export Trace", command=self.export_trace).grid(row=1, column=0, padx=(0, 5), pady=5, sticky="w")
+        ttk.Button(profile_frame, text="Reset", command=self.reset_profile).grid(row=1, column=1, pady=5, sticky="w")
+
+    def repaint(self, bbox):
+        if self.borders is not None:
+            bbox = self.borders.update(bbox, self.registry.owner)
+        self.renderer.invalidate(bbox)
+
+    def set_border_mode(self):
+        mode = self.border_var.get()
+        if self.province_index is None:
+            return
+        if mode and self.borders is None:
+            # built on first use; afterwards repaint keeps it current
+            self.borders = BorderMask(self.province_index.labels, self.registry.owner,
+                                      len(self.renderer.pyramid.levels))
+        self.renderer.set_borders(self.borders, mode)
+        self.update_image()
+
+    def save_project(self):
+        if self.province_index is None:
+            messagebox.showerror("Error", "Pick a provinces PNG first.")
+            return
+        file_path = filedialog.asksaveasfilename(defaultextension=".vsp", filetypes=[("State Painter projects", "*.vsp")])
+        if not file_path:
+            return
+        self.read_form()
+        self.core.save_project(file_path)
+        self.project_label.config(text=f"{file_path} (autosaved after every edit)")
+
+    def open_project(self):
+        path = filedialog.askdirectory(title="Open a .vsp project folder")
+        if not path:
+            return
+        borders = self.borders
+        try:
+            map_path = read_project_meta(path)["map"]
+            if not map_path or not os.path.exists(map_path):
+                map_path = filedialog.askopenfilename(title="Provinces PNG of this project", filetypes=[("PNG files", "*.png")])
+                if not map_path:
+                    return
+            # the old map's mask must not see the new map's repaint
+            self.borders = None
+            self.core.open_project(path, map_path)
+        except (OSError, ValueError) as error:
+            self.borders = borders
+            messagebox.showerror("Error", f"Could not open the project: {error}")
+            return
+        self.map_loaded()
+        self.project_label.config(text=f"{path} (autosaved after every edit)")
+
+    def on_close(self):
+        if self.core.project_path is None and self.registry.states():
+            answer = messagebox.askyesnocancel("Quit", "Save the states as a project before closing?")
+            if answer is None:
+                return
+            if answer:
+                self.save_project()
+                if self.core.project_path is None:
+                    return
+        self.core.close_project()
+        self.root.destroy()
+
+    def toggle_profiling(self):
+        self.profiler.enabled = self.profiling_var.get()
+        self.draw_overlay()
+
+    def reset_profile(self):
+        self.profiler.reset()
+        self.draw_overlay()
+
+    def export_trace(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json",
+                                                 filetypes=[("JSON trace", "*.json"), ("CSV trace", "*.csv")])
+        if file_path:
+            self.profiler.export(file_path, {"input_to_frame": self.frames.stats()})
+
+    def draw_overlay(self):
+        self.canvas.delete("overlay")
+        if not self.overlay_var.get():
+            return
+        text = (self.profiler.overlay_text({"input_to_frame": self.frames.stats()})
+                if self.profiler.enabled else "profiling is off")
+        x, y = self.canvas.canvasx(0) + 8, self.canvas.canvasy(0) + 8
+        item = self.canvas.create_text(x, y, text=text or "no samples yet", anchor="nw",
+                                       font=("Courier", 9), fill="white", tags="overlay")
+        self.canvas.tag_lower(self.canvas.create_rectangle(self.canvas.bbox(item), fill="black",
+                                                           outline="", tags="overlay"), item)
+        # refresh while idle too, so stages outside frames (clicks, imports) show up
+        if self.overlay_after is not None:
+            self.root.after_cancel(self.overlay_after)
+        self.overlay_after = self.root.after(500, self.refresh_overlay)
+
+    def refresh_overlay(self):
+        self.overlay_after = None
+        self.draw_overlay()
+
+    def load_sea_provinces(self):
+        if self.province_index is None:
+            messagebox.showerror("Error", "Pick a provinces PNG first.")
+            return
+        file_path = filedialog.askopenfilename(filetypes=[("Map files", "*.map"), ("All files", "*.*")])
+        if not file_path:
+            return
+        is_sea = self.core.load_sea_provinces(file_path)
+        self.sea_label.config(text=f"{int(is_sea.sum())} sea provinces, {int(self.core.coastal.sum())} coastal")
+        self.update_state_info()
+        self.schedule_validation(force=True)
+
+    def update_state_info(self):
+        stats = self.core.state_info(self.current_state)
+        if stats is None:
+            self.state_info_label.config(text="")
+            return
+        parts = stats["parts"]
+        info = "Contiguous" if parts == 1 else f"Not contiguous ({parts} parts)"
+        if "ports" in stats:
+            info += f"   Port candidates: {stats['ports']}"
+            if not stats["port_coastal"]:
+                info += "   (port hub is not coastal)"
+        x, y = stats["centroid"]
+        info += f"\n{stats['provinces']} provinces   Area: {stats['area']} px   Centre: {int(x)}, {int(y)}"
+        if "coast" in stats:
+            info += f"   Coastline: {stats['coast']} px"
+        self.state_info_label.config(text=info)
+
+    def suggest_defaults(self):
+        if self.province_index is None:
+            return
+        self.core.journal.begin()
+        self.read_form()
+        filled = self.core.apply_suggestions(self.current_state)
+        self.core.journal.commit()
+        if filled:
+            self.fill_form(self.current_state)
+            self.update_provinces_text()
+
+    def undo(self, event=None):
+        if self.core.undo():
+            self.refresh_after_replay()
+
+    def redo(self, event=None):
+        if self.core.redo():
+            self.refresh_after_replay()
+
+    def refresh_after_replay(self):
+        self.current_assignment = None
+        self.fill_form(self.current_state)
+        self.update_provinces_text()
+        self.update_image()
+
+    def import_states(self):
+        if self.province_index is None:
+            messagebox.showerror("Error", "Pick a provinces PNG first.")
+            return
+        file_paths = filedialog.askopenfilenames(filetypes=[("Text files", "*.txt")])
+        if not file_paths:
+            return
+
+        current = self.current_state
+        try:
+            missing, (provinces, ids) = self.core.import_state_files(file_paths)
+        except (OSError, ValueError) as error:
+            messagebox.showerror("Error", f"Could not import the states: {error}")
+            return
+        if self.current_state is not current:
+            self.new_state_form()
+        else:
+            self.update_provinces_text()
+        self.update_image()
+        warnings = [f"{len(missing)} province codes were not found on this map."] if missing else []
+        warnings += [f"{self.province_index.hex_code(label)} is listed by {', '.join(keys)}; kept in {keys[-1]}."
+                     for label, keys in list(provinces.items())[:10]]
+        warnings += [f"ID {state_id} is used by {', '.join(keys)}; kept {keys[-1]}."
+                     for state_id, keys in list(ids.items())[:10]]
+        if len(provinces) > 10 or len(ids) > 10:
+            warnings.append(f"({len(provinces)} duplicate provinces and {len(ids)} duplicate IDs in all)")
+        if warnings:
+            messagebox.showwarning("Import", "\n".join(warnings))
+
+    def export_all_states(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")])
+        if not file_path:
+            return
+        issues = self.core.validator.issues() if self.core.validator is not None else []
+        if issues and not messagebox.askyesno("Export", f"The last check found {len(issues)} issues "
+                                                        "(see the Checks tab). Export anyway?"):
+            return
+        with open(file_path, 'w') as f:
+            f.write(self.core.export_text())
+
+    def change_color(self, event=None):
+        self.core.change_color()
+        self.color_preview.config(bg=self.current_state.color)
+        if self.current_state.provinces:
+            self.update_image()
+
+    def regen_id(self):       
+        self.state_id_entry.delete(0, tk.END)
+        self.state_id_entry.insert(0, str(self.core.next_free_id()))
+
+    def set_current_assignment(self, assignment):
+        self.current_assignment = assignment
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = VicStatePainter(root)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
\ No newline at end of file
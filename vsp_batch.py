@@ -0,0 +1,157 @@
+"""Generate state files without the GUI.
+
+    python vsp_batch.py provinces.png states.png more_states.csv -o out/ -j 4
+
+Each input is a state map PNG (state colours painted over the provinces map),
+a CSV with ``id,name,provinces[,city,port,farm,mine,wood,arable_land]``
+columns (provinces separated by spaces) or a JSON list of state objects with
+the same keys. One state file is written per input.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from province_map import load_province_index, load_rgb, pack_rgb
+from states import HUB_TYPES, State, format_state
+
+_index = None
+
+
+def _init_worker(provinces_path):
+    global _index
+    _index = load_province_index(provinces_path)
+
+
+def states_from_state_map(index, state_map):
+    """Group provinces by the state colour painted over most of their pixels.
+
+    A province is assigned when its most common state colour covers more
+    pixels than are left unpainted; state IDs follow the colour order."""
+    painted = pack_rgb(state_map).ravel()
+    # a tiled label map is read in full here, like the state map
+    labels = np.asarray(index.labels).ravel()
+    area = np.bincount(labels, minlength=index.count)
+    mask = painted != index.colors[labels]
+    painted, labels = painted[mask], labels[mask]
+
+    keys, counts = np.unique(labels.astype(np.int64) << 24 | painted, return_counts=True)
+    if not len(keys):
+        return []
+    key_labels, key_colors = (keys >> 24).astype(np.int32), (keys & 0xFFFFFF).astype(np.int32)
+    order = np.lexsort((-counts, key_labels))
+    first = order[np.r_[True, key_labels[order][1:] != key_labels[order][:-1]]]
+
+    painted_area = np.bincount(key_labels, weights=counts, minlength=index.count)
+    best = first[counts[first] > area[key_labels[first]] - painted_area[key_labels[first]]]
+    province_labels, state_colors = key_labels[best], key_colors[best]
+
+    colors, inverse = np.unique(state_colors, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    splits = np.cumsum(np.bincount(inverse, minlength=len(colors)))[:-1]
+    states = []
+    for state_id, (color, members) in enumerate(zip(colors, np.split(province_labels[order], splits)), 1):
+        state = State(state_id, str(state_id), "#{:06x}".format(int(color)))
+        state.provinces = dict.fromkeys(members.tolist())
+        states.append(state)
+    return states
+
+
+def state_from_record(index, record, missing):
+    state = State(int(record["id"]), str(record.get("name", record["id"])))
+    codes = record.get("provinces", [])
+    if isinstance(codes, str):
+        codes = codes.split()
+    labels = index.labels_of(codes)
+    missing.extend(code for code, label in zip(codes, labels) if label < 0)
+    state.provinces = dict.fromkeys(labels[labels >= 0].tolist())
+
+    for hub in HUB_TYPES:
+        if record.get(hub):
+            label = index.label_of(record[hub])
+            if label is None:
+                missing.append(record[hub])
+            else:
+                state.hubs[hub] = label
+    if str(record.get("arable_land", "")).strip():
+        state.arable_land = int(record["arable_land"])
+    state.subsistence_building = record.get("subsistence_building", "")
+    state.arable_resources = list(record.get("arable_resources", []))
+    state.capped_resources = {res: str(value) for res, value in record.get("capped_resources", {}).items()}
+    state.special_resources = {res: str(value) for res, value in record.get("resources", {}).items()}
+    return state
+
+
+def read_states(index, path):
+    missing = []
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".png":
+        state_map = load_rgb(path)
+        if state_map.shape[:2] != (index.height, index.width):
+            raise ValueError(f"{path}: state map is not the same size as the provinces map")
+        return states_from_state_map(index, state_map), missing
+    if extension == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            records = list(csv.DictReader(f))
+    elif extension == ".json":
+        with open(path, encoding="utf-8-sig") as f:
+            records = json.load(f)
+    else:
+        raise ValueError(f"{path}: expected a .png, .csv or .json file")
+    return [state_from_record(index, record, missing) for record in records], missing
+
+
+def write_states(index, states, path):
+    with open(path, "w") as f:
+        for state in states:
+            f.write(format_state(state, index) + "\n")
+
+
+def output_paths(inputs, output_dir):
+    stems = [os.path.splitext(os.path.basename(path)) for path in inputs]
+    counts = {}
+    for stem, _ in stems:
+        counts[stem] = counts.get(stem, 0) + 1
+    return [os.path.join(output_dir, (stem if counts[stem] == 1 else stem + "_" + extension.lstrip(".")) + ".txt")
+            for stem, extension in stems]
+
+
+def convert(path, output):
+    states, missing = read_states(_index, path)
+    write_states(_index, states, output)
+    return output, len(states), missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Victoria 3 state files from state maps or tables.")
+    parser.add_argument("provinces", help="provinces.png the state files refer to")
+    parser.add_argument("inputs", nargs="+", help="state map PNGs, CSV or JSON files")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory for the generated .txt files")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes")
+    args = parser.parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    outputs = output_paths(args.inputs, args.output_dir)
+
+    if len(args.inputs) == 1 or args.jobs <= 1:
+        _init_worker(args.provinces)
+        results = [convert(path, output) for path, output in zip(args.inputs, outputs)]
+    else:
+        # build the index cache once so the workers only memory-map it
+        load_province_index(args.provinces)
+        with ProcessPoolExecutor(min(args.jobs, len(args.inputs)), initializer=_init_worker,
+                                 initargs=(args.provinces,)) as pool:
+            results = list(pool.map(convert, args.inputs, outputs))
+
+    for output, count, missing in results:
+        print(f"{output}: {count} states")
+        if missing:
+            print(f"  {len(missing)} province codes not found on the map: {' '.join(missing[:10])}",
+                  file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
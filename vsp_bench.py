@@ -0,0 +1,257 @@
+"""Benchmark the painter's hot paths on synthetic province maps, without Tk.
+
+    python vsp_bench.py --provinces 10000 50000 --save bench.json
+    python vsp_bench.py --compare bench.json
+
+Maps are 8192x3616 Voronoi-style province maps generated from a fixed seed.
+Each run measures click and unclick latency, pan/zoom frame time (plain and
+with borders drawn), bulk import, export throughput and peak memory (traced
+while the map is indexed, and the process peak RSS, which includes generating
+the map). ``--compare`` reports every metric that got worse than the saved
+baseline by more than ``--threshold`` and exits with status 1 if there is any.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+from time import perf_counter
+
+import numpy as np
+
+from borders import PROVINCE_EDGE, STATE_EDGE, BorderMask
+from painter_core import PainterCore
+from province_map import ProvinceIndex
+from renderer import TILE_SIZE, MapPyramid, composite_tile, view_tiles
+from states import State, format_state
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+WIDTH, HEIGHT = 8192, 3616
+VIEW = (1400, 1000)
+HIGHER_IS_BETTER = {"export_mb_per_s"}
+# sub-millisecond timings jitter by more than any threshold; ignore tiny changes
+MIN_CHANGE_MS = 0.05
+
+
+def synthetic_map(provinces, width=WIDTH, height=HEIGHT, seed=0):
+    """RGB image of about ``provinces`` Voronoi cells with distinct colours.
+
+    Seeds are jittered on a grid, so the nearest seed of any pixel lies in its
+    own grid cell or one of the eight around it; rows are done one cell-row
+    band at a time to keep memory flat."""
+    rng = np.random.default_rng(seed)
+    cell = max(2, int(np.sqrt(width * height / provinces)))
+    gw, gh = -(-width // cell), -(-height // cell)
+    seed_x = (np.arange(gw) * cell)[None, :] + rng.integers(0, cell, (gh, gw))
+    seed_y = (np.arange(gh) * cell)[:, None] + rng.integers(0, cell, (gh, gw))
+    seed_x, seed_y = np.pad(seed_x, 1, mode="edge"), np.pad(seed_y, 1, mode="edge")
+    cell_ids = np.pad(np.arange(gh * gw).reshape(gh, gw), 1, mode="edge")
+
+    labels = np.empty((height, width), np.int32)
+    xs = np.arange(width)
+    cx = xs // cell + 1
+    for gy in range(gh):
+        y0, y1 = gy * cell, min(height, (gy + 1) * cell)
+        ys = np.arange(y0, y1)[:, None]
+        best = np.full((y1 - y0, width), np.inf, np.float32)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                sx, sy = seed_x[gy + 1 + dy, cx + dx], seed_y[gy + 1 + dy, cx + dx]
+                dist = ((xs - sx) ** 2)[None, :] + (ys - sy) ** 2
+                closer = dist < best
+                best[closer] = dist[closer]
+                labels[y0:y1][closer] = np.broadcast_to(cell_ids[gy + 1 + dy, cx + dx], closer.shape)[closer]
+
+    colors = rng.choice(1 << 24, gh * gw, replace=False)
+    rgb = np.stack([colors >> 16, colors >> 8 & 0xFF, colors & 0xFF], axis=-1).astype(np.uint8)
+    return rgb[labels]
+
+
+def percentiles(samples, name):
+    samples = np.asarray(samples) * 1000
+    return {f"{name}_p50_ms": float(np.percentile(samples, 50)),
+            f"{name}_p95_ms": float(np.percentile(samples, 95)),
+            f"{name}_max_ms": float(samples.max())}
+
+
+def bench_clicks(core, rng, clicks):
+    """Time a click as the GUI does it: toggle ownership, then regenerate the
+    state text. Unclicks remove the same provinces in reverse order."""
+    labels = rng.choice(core.province_index.count, clicks, replace=False)
+    click, unclick = [], []
+    for label in labels:
+        start = perf_counter()
+        core.toggle_province(int(label))
+        format_state(core.current_state, core.province_index)
+        click.append(perf_counter() - start)
+    for label in labels[::-1]:
+        start = perf_counter()
+        core.toggle_province(int(label))
+        format_state(core.current_state, core.province_index)
+        unclick.append(perf_counter() - start)
+    return {**percentiles(click, "click"), **percentiles(unclick, "unclick")}
+
+
+def bench_frames(core, rng, frames, cache_size=256, border_mode=0, name="frame"):
+    """Frame time of the tile compositor along a random walk of pans and zooms.
+
+    Follows TileRenderer.draw minus the Tk upload: tiles missing from the LRU
+    cache go through the renderer's composite_tile, with borders drawn when
+    ``border_mode`` is set. Also reports the composited bytes per frame."""
+    pyramid = MapPyramid(core.province_index.labels)
+    borders = (BorderMask(core.province_index.labels, core.registry.owner, len(pyramid.levels))
+               if border_mode else None)
+    cache = OrderedDict()
+    scale, vec = 0.5, [0.0, 0.0]
+    times = []
+    allocated = 0
+    for _ in range(frames):
+        if rng.random() < 0.2:
+            scale = float(np.clip(scale * (1.3 if rng.random() < 0.5 else 1 / 1.3), 0.18, 8.0))
+        else:
+            vec[0] += rng.normal(0, 120) / scale
+            vec[1] += rng.normal(0, 60) / scale
+        vec[0] = float(np.clip(vec[0], 0, max(0, WIDTH - VIEW[0] / scale)))
+        vec[1] = float(np.clip(vec[1], 0, max(0, HEIGHT - VIEW[1] / scale)))
+
+        start = perf_counter()
+        origin = int(round(vec[0] * scale)), int(round(vec[1] * scale))
+        visible, _ = view_tiles(pyramid.levels[0].shape, scale, origin, (0, 0) + VIEW)
+        for tx, ty in visible:
+            key = round(scale, 9), tx, ty
+            if key in cache:
+                cache.move_to_end(key)
+                continue
+            cache[key] = composite_tile(pyramid, core.display_colors, scale, tx, ty, TILE_SIZE, borders, border_mode)
+            allocated += cache[key].nbytes
+            while len(cache) > cache_size:
+                cache.popitem(last=False)
+        times.append(perf_counter() - start)
+    metrics = percentiles(times, name)
+    metrics[f"{name}_kb_allocated"] = allocated / frames / 1024
+    return metrics
+
+
+def write_state_files(index, directory, per_state=20, per_file=100):
+    """Split every province into states of ``per_state`` provinces and write
+    them as state files, ``per_file`` states each."""
+    labels = np.random.default_rng(1).permutation(index.count)
+    states = []
+    for state_id, start in enumerate(range(0, index.count, per_state), 1):
+        state = State(state_id, f"bench_{state_id}")
+        state.provinces = dict.fromkeys(labels[start:start + per_state].tolist())
+        state.arable_land = 20
+        states.append(state)
+    paths = []
+    for start in range(0, len(states), per_file):
+        path = os.path.join(directory, f"states_{start // per_file:04d}.txt")
+        with open(path, "w") as f:
+            f.write("".join(format_state(state, index) + "\n" for state in states[start:start + per_file]))
+        paths.append(path)
+    return paths
+
+
+def bench_import_export(core, directory):
+    paths = write_state_files(core.province_index, directory)
+    start = perf_counter()
+    core.import_state_files(paths)
+    import_time = perf_counter() - start
+
+    start = perf_counter()
+    text = core.export_text()
+    export_time = perf_counter() - start
+    size = len(text.encode()) / 2 ** 20
+    return {"import_s": import_time, "import_states": len(core.registry.states()),
+            "export_s": export_time, "export_mb_per_s": size / export_time}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def run(provinces, clicks, frames):
+    metrics = {}
+    start = perf_counter()
+    image = synthetic_map(provinces)
+    metrics["generate_s"] = perf_counter() - start
+
+    tracemalloc.start()
+    start = perf_counter()
+    index = ProvinceIndex(image)
+    del image
+    core = PainterCore()
+    core.set_index(index)
+    metrics["load_s"] = perf_counter() - start
+    metrics["load_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    metrics["provinces"] = index.count
+
+    rng = np.random.default_rng(2)
+    metrics.update(bench_clicks(core, rng, clicks))
+    metrics.update(bench_frames(core, rng, frames))
+    metrics.update(bench_frames(core, rng, frames, border_mode=STATE_EDGE | PROVINCE_EDGE, name="border_frame"))
+    with tempfile.TemporaryDirectory() as directory:
+        metrics.update(bench_import_export(core, directory))
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for size, metrics in results.items():
+        for name, value in metrics.items():
+            old = baseline.get(size, {}).get(name)
+            if name == "generate_s" or not name.endswith(("_ms", "_s", "_mb")) or not old or value is None:
+                continue
+            change = (value - old) / old
+            if name in HIGHER_IS_BETTER:
+                change = -change
+            noise = name.endswith("_ms") and abs(value - old) < MIN_CHANGE_MS
+            flag = "REGRESSION" if change > threshold and not noise else ""
+            print(f"{size:>8} {name:<18} {old:12.3f} -> {value:12.3f} {change:+8.1%} {flag}")
+            if flag:
+                regressions.append((size, name))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--provinces", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--clicks", type=int, default=200)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed slowdown (default 0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for provinces in args.provinces:
+        results[str(provinces)] = run(provinces, args.clicks, args.frames)
+        print(f"{provinces} provinces:")
+        for name, value in results[str(provinces)].items():
+            print(f"  {name:<18} {value if value is None else round(value, 3)}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())